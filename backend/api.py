@@ -1,21 +1,30 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
-from backend.camera_manager import camera_manager
-from backend.llm_service import llm_service
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import APIRouter, HTTPException, Request
+from backend.camera_manager import camera_manager, pin_current_thread
+from backend.llm_service import get_llm_service
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse, Response
 from pydantic import BaseModel
 import os
-import json
-import cv2
+import stat
+import hashlib
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+import orjson
 import numpy as np
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-import sys
+from typing import List, Optional, Any
 import threading
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from config_loader import get_config
 from image_processing import (
+    load_image,
+    encode_jpeg,
     process_with_green_background,
+    resize_to_max_dim,
+    save_jpeg,
 )
 
 router = APIRouter()
@@ -24,6 +33,258 @@ config = get_config()
 # Ensure captures directory exists
 CAPTURES_DIR = os.path.join(os.getcwd(), config.get_captures_dir())
 os.makedirs(CAPTURES_DIR, exist_ok=True)
+CAPTURES_PATH = Path(CAPTURES_DIR).resolve()
+
+# Shared YomiToku OCR instances (loading the model weights is expensive),
+# keyed by whether they render a visualization image
+_ocr_instances = {}
+_ocr_lock = threading.Lock()
+# YomiToku isn't guaranteed to be thread-safe, so inference is serialized
+_ocr_inference_lock = threading.Lock()
+
+def _ocr_device() -> str:
+    device = config.get_ocr_device()
+    if device != "auto":
+        return device
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+def _limit_ocr_threads():
+    """Cap the inference thread pools; by default they spin up one per core
+    and fight the capture thread for CPU."""
+    threads = config.get_ocr_threads()
+    if threads <= 0:
+        return
+    # Best effort only: OpenMP reads this once, when its runtime first starts,
+    # and an OMP_NUM_THREADS the user already set is left alone
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    try:
+        import torch
+        # The authoritative limit; applies even if OpenMP is already running
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def get_ocr(visualize: bool = False):
+    """Return the shared OCR instance, loading the model on first use"""
+    with _ocr_lock:
+        if visualize not in _ocr_instances:
+            if not _ocr_instances:
+                _limit_ocr_threads()
+            # Imported here: yomitoku pulls in torch, which is slow to import.
+            # This way it loads in the startup pre-warm thread, alongside the camera.
+            from yomitoku import OCR
+            _ocr_instances[visualize] = OCR(visualize=visualize, device=_ocr_device())
+        return _ocr_instances[visualize]
+
+def _scale_points(data, factor: float):
+    """Scale every "points" polygon in OCR output back to source-image pixels"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == "points" and isinstance(value, list):
+                data[key] = [[x * factor, y * factor] for x, y in value]
+            else:
+                _scale_points(value, factor)
+    elif isinstance(data, list):
+        for item in data:
+            _scale_points(item, factor)
+
+def run_ocr(image: np.ndarray, visualize: bool = False):
+    """Run OCR with the shared instance; returns (jsonable results, visualization)
+
+    Large images are downscaled first so inference time stays bounded; box
+    coordinates are mapped back to the original image size.
+    """
+    h, w = image.shape[:2]
+    small = resize_to_max_dim(image, _ocr_max_dim)
+    ocr = get_ocr(visualize)
+    with _ocr_inference_lock:
+        # Let the capture thread thin out marker detection meanwhile
+        camera_manager.ocr_busy = True
+        try:
+            results, ocr_vis = ocr(small)
+        finally:
+            camera_manager.ocr_busy = False
+    json_results = _to_jsonable(results)
+    if small is not image:
+        _scale_points(json_results, max(h, w) / max(small.shape[:2]))
+    return json_results, ocr_vis
+
+# Bounded pool for background OCR (avoid one thread per capture)
+_ocr_pool = ThreadPoolExecutor(
+    max_workers=config.get_ocr_workers(),
+    thread_name_prefix="ocr",
+    initializer=pin_current_thread,
+    initargs=(config.get_ocr_cpu_affinity(),),
+)
+_ocr_max_pending = config.get_ocr_max_pending()
+_ocr_max_dim = config.get_ocr_max_dim()
+_ocr_pending = {}  # Image content hash -> other capture paths waiting on that job
+_ocr_pending_lock = threading.Lock()
+
+def submit_ocr(image_path: str, image: Optional[np.ndarray] = None) -> bool:
+    """Queue background OCR; drops the job if too many are already pending.
+
+    Jobs are keyed by image content: a capture identical to one already
+    OCR'd is answered right away from the hash cache, and one identical to
+    a job still queued or running joins it and gets its result copied when
+    it finishes. If the caller still has the saved image in memory it can
+    pass it in, so the JPEG it was just given isn't read and decoded again.
+    """
+    if image is None:
+        image = load_image(image_path)
+        if image is None:
+            print(f"Error loading image for OCR: {image_path}")
+            return False
+    image_hash = _image_hash(image)
+    if _reuse_cached_ocr(image_hash, image_path):
+        return True
+
+    with _ocr_pending_lock:
+        if image_hash in _ocr_pending:
+            _ocr_pending[image_hash].append(image_path)
+            return True
+        if len(_ocr_pending) >= _ocr_max_pending:
+            print(f"OCR queue full, skipping: {image_path}")
+            return False
+        _ocr_pending[image_hash] = []
+
+    def _run():
+        try:
+            perform_ocr_background(image_path, image, image_hash)
+        finally:
+            with _ocr_pending_lock:
+                waiters = _ocr_pending.pop(image_hash, [])
+            for path in waiters:
+                if not _reuse_cached_ocr(image_hash, path):
+                    print(f"OCR result unavailable for {path}")
+
+    _ocr_pool.submit(_run)
+    return True
+
+def warm_up_ocr():
+    """Load the OCR model on the OCR worker and run one tiny inference.
+
+    The first call into the model does one-time setup (kernel selection,
+    allocator growth, CUDA context), so doing it at startup keeps that cost
+    off the first real capture. Returns the pool future.
+    """
+    return _ocr_pool.submit(run_ocr, np.full((64, 64, 3), 255, dtype=np.uint8))
+
+def _load_json(path: str):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+# Parsed subject mappings, reloaded only when the file's mtime changes.
+# "by_id" is the same mapping keyed by int marker id, built once per load
+_mapping_cache = {"mtime": None, "value": {}, "by_id": {}}
+_mapping_lock = threading.Lock()
+
+def _index_mappings(mappings: dict) -> dict:
+    """Re-key {"id": subject} by int, so detector ids need no str() per lookup"""
+    by_id = {}
+    for key, subject in mappings.items():
+        try:
+            by_id[int(key)] = subject
+        except (TypeError, ValueError):
+            pass
+    return by_id
+
+def _load_subject_mappings() -> tuple:
+    """Return (mappings, mappings by int id), re-reading the JSON file only if it changed"""
+    mapping_file = os.path.join(os.getcwd(), config.get_subject_mappings_file())
+    try:
+        mtime = os.stat(mapping_file).st_mtime_ns
+    except OSError:
+        return {}, {}
+
+    with _mapping_lock:
+        if _mapping_cache["mtime"] != mtime:
+            _mapping_cache["value"] = _load_json(mapping_file)
+            _mapping_cache["by_id"] = _index_mappings(_mapping_cache["value"])
+            _mapping_cache["mtime"] = mtime
+        return _mapping_cache["value"], _mapping_cache["by_id"]
+
+def _get_subject_mappings() -> dict:
+    """Return subject mappings as stored ({"marker id": subject})"""
+    return _load_subject_mappings()[0]
+
+# Timestamp prefix cached per second: [epoch second, formatted prefix, count]
+_ts_last = [0, None, 0]
+_ts_lock = threading.Lock()
+
+def _capture_timestamp() -> str:
+    """Timestamp for capture filenames ("%Y%m%d_%H%M%S").
+
+    A counter suffix is added for further captures within the same second
+    so they don't overwrite each other.
+    """
+    now = int(time.time())
+    with _ts_lock:
+        if now != _ts_last[0]:
+            _ts_last[:] = [now, time.strftime("%Y%m%d_%H%M%S", time.localtime(now)), 0]
+        _ts_last[2] += 1
+        if _ts_last[2] == 1:
+            return _ts_last[1]
+        return f"{_ts_last[1]}_{_ts_last[2]}"
+
+def _json_bytes(data) -> bytes:
+    # orjson writes UTF-8 as-is (like ensure_ascii=False) and handles numpy arrays
+    return orjson.dumps(
+        data,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+    )
+
+def _save_json(path: str, data) -> None:
+    # Write to a temp file and rename so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_json_bytes(data))
+    os.replace(tmp_path, path)
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _to_jsonable(results):
+    """Convert YomiToku results (Pydantic models or lists of them) to plain data"""
+    if hasattr(results, 'model_dump'):
+        return results.model_dump()
+    if hasattr(results, 'dict'):
+        return results.dict()
+    if isinstance(results, list):
+        return [r.model_dump() if hasattr(r, 'model_dump') else (r.dict() if hasattr(r, 'dict') else r) for r in results]
+    return results
+
+def _save_capture_files(items: List[tuple]) -> None:
+    """Encode all capture outputs in memory first, then write them in one pass.
+
+    items: list of (path, payload); ndarray payloads are saved as JPEG,
+    anything else as JSON. Each file appears atomically under its final name.
+    """
+    encoded = []
+    for path, payload in items:
+        if isinstance(payload, np.ndarray):
+            data = encode_jpeg(payload)
+            if not data:
+                raise RuntimeError(f"Failed to encode {path}")
+        else:
+            data = _json_bytes(payload)
+        encoded.append((path, data))
+
+    for path, data in encoded:
+        # Write to a temp file and rename, so a capture that is listed (and
+        # cached by the browser as immutable) is never a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+# Live streams must not be cached or buffered by proxies
+_STREAM_HEADERS = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
 
 class SettingsUpdate(BaseModel):
     mappings: dict
@@ -31,12 +292,17 @@ class SettingsUpdate(BaseModel):
 class OCRRequest(BaseModel):
     image_path: Optional[str] = None
     use_last_capture: bool = True
+    visualize: bool = False  # Also render and save an "_ocr.jpg" overlay image
 
 class StudyRequest(BaseModel):
     text: str
     type: str  # "explain" or "problem"
     context: Optional[str] = None  # Full document context
 
+class AnalyzeRequest(BaseModel):
+    text: str
+    context: Optional[str] = None  # Full document context
+
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
     content: str
@@ -46,66 +312,82 @@ class ChatRequest(BaseModel):
     history: List[dict]  # List of {role, content}
     context: Optional[str] = None  # Document context
 
-@router.get("/stream")
+@router.get("/stream", include_in_schema=False)
 async def video_stream():
     """Stream video from the camera"""
     return StreamingResponse(
         camera_manager.generate_stream(),
-        media_type="multipart/x-mixed-replace; boundary=frame"
+        media_type="multipart/x-mixed-replace; boundary=frame",
+        headers=_STREAM_HEADERS,
     )
 
 @router.get("/status")
 async def get_status():
     return {"status": "ok", "camera_connected": camera_manager.cap is not None}
 
-@router.get("/capture_status")
+@router.get("/capture_status", include_in_schema=False)
 async def capture_status_stream(request: Request):
     """SSE stream for capture status"""
     async def event_generator():
-        while True:
-            if await request.is_disconnected():
-                break
-
-            # Get state
-            progress = camera_manager.current_progress
-            triggered = camera_manager.auto_capture_triggered
-
-            data = json.dumps({"progress": progress, "triggered": triggered})
-            yield f"data: {data}\n\n"
-            await asyncio.sleep(0.05) # 20fps updates
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+        status_event = camera_manager.subscribe_status()
+        last_state = None
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+
+                # Get state
+                state = (camera_manager.current_progress, camera_manager.auto_capture_triggered)
+
+                if state != last_state:
+                    data = orjson.dumps({"progress": state[0], "triggered": state[1]})
+                    yield b"data: " + data + b"\n\n"
+                    last_state = state
+                else:
+                    # Heartbeat so disconnects are noticed and proxies keep the stream open
+                    yield b": keep-alive\n\n"
+
+                # Wait for a status change (or the heartbeat timeout)
+                try:
+                    await asyncio.wait_for(status_event.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                status_event.clear()
+        finally:
+            camera_manager.unsubscribe_status(status_event)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=_STREAM_HEADERS)
 
 @router.post("/capture")
-async def capture_image(background_tasks: BackgroundTasks):
+async def capture_image():
     """Capture current frame and save it"""
     frame = camera_manager.get_frame()
     if frame is None:
         raise HTTPException(status_code=503, detail="Camera not available")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = _capture_timestamp()
     filename = f"capture_{timestamp}.jpg"
     filepath = os.path.join(CAPTURES_DIR, filename)
 
-    # Save original
     original_filename = f"capture_{timestamp}_original.jpg"
     original_filepath = os.path.join(CAPTURES_DIR, original_filename)
-    cv2.imwrite(original_filepath, frame)
 
     # Process with green background detection
-    process_frame, success = process_with_green_background(frame, enhance=True)
+    process_frame, success = await asyncio.to_thread(process_with_green_background, frame, True)
 
     # Resize if too large
-    max_dim = 2000
-    h, w = process_frame.shape[:2]
-    if h > max_dim or w > max_dim:
-        scale = max_dim / max(h, w)
-        process_frame = cv2.resize(process_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    process_frame = resize_to_max_dim(process_frame, 2000)
 
-    cv2.imwrite(filepath, process_frame)
+    # Save original + processed together
+    await asyncio.to_thread(_save_capture_files, [
+        (original_filepath, frame),
+        (filepath, process_frame),
+    ])
 
-    # Trigger background OCR
-    background_tasks.add_task(perform_ocr_background, filepath)
+    # Only once the capture exists: the OCR JSON is written next to it.
+    # The in-memory image is passed so the JPEG isn't read back (hashing for
+    # the cache check happens here, so keep it off the event loop)
+    await asyncio.to_thread(submit_ocr, filepath, process_frame)
 
     return {
         "success": True,
@@ -114,46 +396,92 @@ async def capture_image(background_tasks: BackgroundTasks):
         "url": f"/api/captures/{filename}"
     }
 
-def perform_ocr_background(image_path: str):
+# Content-hash -> OCR JSON (relative to CAPTURES_DIR), persisted across restarts
+OCR_HASH_INDEX_FILE = os.path.join(CAPTURES_DIR, ".ocr_hash_index.json")
+OCR_HASH_INDEX_MAX = 256
+_ocr_hash_index = None
+_ocr_hash_lock = threading.Lock()
+
+def _image_hash(image: np.ndarray) -> str:
+    return hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+
+def _get_ocr_hash_index() -> OrderedDict:
+    """Load the hash index on first use (call with _ocr_hash_lock held)"""
+    global _ocr_hash_index
+    if _ocr_hash_index is None:
+        _ocr_hash_index = OrderedDict()
+        if os.path.exists(OCR_HASH_INDEX_FILE):
+            try:
+                _ocr_hash_index.update(_load_json(OCR_HASH_INDEX_FILE))
+            except Exception as e:
+                print(f"Failed to load OCR hash index: {e}")
+    return _ocr_hash_index
+
+def _ocr_json_path(image_path: str) -> str:
+    """OCR results are saved next to the capture, with a .json extension"""
+    return os.path.splitext(image_path)[0] + ".json"
+
+def _reuse_cached_ocr(image_hash: str, image_path: str) -> bool:
+    """Copy the OCR JSON of identical earlier content to this capture, if any"""
+    json_path = _ocr_json_path(image_path)
+    # Hold the lock for the copy too, so the source can't be replaced mid-copy
+    with _ocr_hash_lock:
+        index = _get_ocr_hash_index()
+        rel_path = index.get(image_hash)
+        if rel_path is None:
+            return False
+        cached_json = os.path.join(CAPTURES_DIR, rel_path)
+        if not os.path.exists(cached_json):
+            # The capture was deleted
+            del index[image_hash]
+            return False
+        index.move_to_end(image_hash)
+        if os.path.abspath(cached_json) != os.path.abspath(json_path):
+            # Copy via a temp file and rename so readers never see a partial file
+            tmp_path = f"{json_path}.tmp"
+            shutil.copyfile(cached_json, tmp_path)
+            os.replace(tmp_path, json_path)
+    print(f"OCR reused cached result for {image_path}")
+    return True
+
+def _store_ocr_cache(image_hash: str, json_path: str):
+    with _ocr_hash_lock:
+        index = _get_ocr_hash_index()
+        index[image_hash] = os.path.relpath(json_path, CAPTURES_DIR)
+        index.move_to_end(image_hash)
+        while len(index) > OCR_HASH_INDEX_MAX:
+            index.popitem(last=False)
+        try:
+            _save_json(OCR_HASH_INDEX_FILE, index)
+        except Exception as e:
+            print(f"Failed to save OCR hash index: {e}")
+
+def perform_ocr_background(image_path: str, image: Optional[np.ndarray] = None,
+                           image_hash: Optional[str] = None):
     """Background task to run OCR and save results"""
     try:
-        # Load image
-        image = cv2.imread(image_path)
+        # Load image (unless the caller passed the in-memory copy)
+        if image is None:
+            image = load_image(image_path)
         if image is None:
             print(f"Error loading image for OCR: {image_path}")
             return
 
-        from yomitoku import OCR
-        # Initialize OCR (Ideally should be shared/Global to avoid reloading)
-        # Note: Initializing model inside a background task might be slow every time.
-        # For a hackathon/demo, it's acceptable but maybe inefficient.
-        ocr = OCR(visualize=True, device="cpu")
-        results, ocr_vis = ocr(image)
+        json_path = _ocr_json_path(image_path)
 
-        # Save visualization (optional, maybe we don't need it if we have overlay)
-        # But keeping it for debug or fallback
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        vis_filename = f"{base_name}_ocr.jpg"
-        vis_path = os.path.join(os.path.dirname(image_path), vis_filename)
-        cv2.imwrite(vis_path, ocr_vis)
+        # Reuse the result if identical image content was already OCR'd
+        # (checked again here: an identical capture may have finished meanwhile)
+        if image_hash is None:
+            image_hash = _image_hash(image)
+        if _reuse_cached_ocr(image_hash, image_path):
+            return
+
+        # No visualization here; the frontend draws overlays from the JSON boxes
+        json_results, _ = run_ocr(image)
 
         # Save JSON
-        json_filename = f"{base_name}.json"
-        json_path = os.path.join(os.path.dirname(image_path), json_filename)
-
-        # Ensure results are JSON serializable
-        # Yomitoku results (OCRSchema) are Pydantic models or similar
-        json_results = results
-        if hasattr(results, 'model_dump'):
-             json_results = results.model_dump()
-        elif hasattr(results, 'dict'):
-             json_results = results.dict()
-        elif isinstance(results, list):
-             # List of objects?
-             json_results = [r.model_dump() if hasattr(r, 'model_dump') else (r.dict() if hasattr(r, 'dict') else r) for r in results]
-
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_results, f, ensure_ascii=False, indent=2)
+        _save_json(json_path, json_results)
+        _store_ocr_cache(image_hash, json_path)
 
         print(f"OCR completed for {image_path}")
 
@@ -177,9 +505,12 @@ async def get_ocr_result(filename: str):
         return {"results": None, "status": "not_found"}
 
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return {"results": data, "status": "ok"}
+        # The file is already JSON; embed it as-is instead of parsing and re-encoding
+        data = await asyncio.to_thread(_read_bytes, json_path)
+        return Response(
+            content=b'{"results":' + data + b',"status":"ok"}',
+            media_type="application/json",
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -191,33 +522,93 @@ async def study_support(request: StudyRequest):
 
     result = ""
     if request.type == "explain":
-        result = llm_service.explain_text(request.text, request.context)
+        result = await get_llm_service().explain_text(request.text, request.context)
     elif request.type == "problem":
-        result = llm_service.create_problems(request.text, request.context)
+        result = await get_llm_service().create_problems(request.text, request.context)
     else:
         raise HTTPException(status_code=400, detail="Invalid support type")
 
     return {"content": result}
 
 
+@router.post("/analyze")
+async def analyze(request: AnalyzeRequest):
+    """Generate both explanation and practice problems for the text in one call"""
+    if not request.text:
+         raise HTTPException(status_code=400, detail="Text is required")
+
+    return await get_llm_service().generate_all(request.text, request.context)
+
+
 @router.post("/chat")
 async def chat_with_ai(request: ChatRequest):
     """Continue a conversation with AI"""
     if not request.message:
         raise HTTPException(status_code=400, detail="Message is required")
 
-    result = llm_service.chat(request.message, request.history, request.context)
+    result = await get_llm_service().chat(request.message, request.history, request.context)
     return {"content": result}
 
 
+async def _sse_tokens(chunks):
+    """Wrap text chunks as SSE events: {"token": ...} per chunk, then {"done": true}"""
+    async for chunk in chunks:
+        yield b"data: " + orjson.dumps({"token": chunk}) + b"\n\n"
+    yield b'data: {"done":true}\n\n'
+
+@router.post("/study_support/stream")
+async def study_support_stream(request: StudyRequest):
+    """Stream study support content as server-sent events"""
+    if not request.text:
+         raise HTTPException(status_code=400, detail="Text is required")
+
+    if request.type == "explain":
+        chunks = get_llm_service().explain_text_stream(request.text, request.context)
+    elif request.type == "problem":
+        chunks = get_llm_service().create_problems_stream(request.text, request.context)
+    else:
+        raise HTTPException(status_code=400, detail="Invalid support type")
+
+    return StreamingResponse(_sse_tokens(chunks), media_type="text/event-stream", headers=_STREAM_HEADERS)
+
+
+@router.post("/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """Continue a conversation with AI, streaming the answer as server-sent events"""
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+
+    chunks = get_llm_service().chat_stream(request.message, request.history, request.context)
+    return StreamingResponse(_sse_tokens(chunks), media_type="text/event-stream", headers=_STREAM_HEADERS)
+
+
+def _ocr_file(target_path: str, visualize: bool = False):
+    """Load an image and OCR it; returns (jsonable results, visualization URL or None)"""
+    image = load_image(target_path)
+    if image is None:
+        raise HTTPException(status_code=500, detail="Failed to load image")
+
+    json_results, ocr_vis = run_ocr(image, visualize)
+
+    # Save visualization (only if requested)
+    vis_image_url = None
+    if visualize and ocr_vis is not None:
+        base_name = os.path.splitext(os.path.basename(target_path))[0]
+        vis_filename = f"{base_name}_ocr.jpg"
+        vis_path = os.path.join(CAPTURES_DIR, vis_filename)
+        save_jpeg(vis_path, ocr_vis)
+        vis_image_url = f"/api/captures/{vis_filename}"
+
+    return json_results, vis_image_url
+
 @router.post("/ocr")
 async def perform_ocr(request: OCRRequest):
-    """Perform OCR on an image"""
+    """Perform OCR on an image on the persistent OCR worker"""
     target_path = None
 
     if request.use_last_capture:
         # Find latest file in captures dir
-        files = glob_captures()
+        files = await asyncio.to_thread(glob_captures)
         if not files:
             raise HTTPException(status_code=404, detail="No captures found")
         target_path = files[0]['filepath'] # First is newest
@@ -231,56 +622,29 @@ async def perform_ocr(request: OCRRequest):
     else:
         raise HTTPException(status_code=400, detail="No image specified")
 
-    # Load image
-    image = cv2.imread(target_path)
-    if image is None:
-        raise HTTPException(status_code=500, detail="Failed to load image")
-
-    # Pre-processing (ArUco, Dewarping, etc.) should ideally happen here
-    # to maintain consistency with the desktop app's "AI processing".
-    # We will implement a simplified synchronous version or reuse the worker logic.
-    # Since YomiToku is heavy, we should probably run it.
-
+    # Run on the same warm worker thread as background OCR instead of
+    # holding a Starlette threadpool thread while waiting for the model
     try:
-        from yomitoku import OCR
-        # Initialize OCR (Should be global or cached to avoid reloading model)
-        # For now, minimal implementation
-        ocr = OCR(visualize=True, device="cpu") # Force CPU or let it decide
-        results, ocr_vis = ocr(image)
-
-        # Save visualization
-        base_name = os.path.splitext(os.path.basename(target_path))[0]
-        vis_filename = f"{base_name}_ocr.jpg"
-        vis_path = os.path.join(CAPTURES_DIR, vis_filename)
-        cv2.imwrite(vis_path, ocr_vis)
-
-        # Extract text (JSON serializable)
-        # results structure depends on yomitoku version, typically list of blocks/lines
-        # We'll just return the full result structure as JSON
-
-        # Adapt results to be JSON serializable if needed
-        # Assuming results is dict or list of dicts with primitives
-
-        return {
-            "success": True,
-            "results": results,
-            "vis_image_url": f"/api/captures/{vis_filename}"
-        }
-
+        results, vis_image_url = await asyncio.wrap_future(
+            _ocr_pool.submit(_ocr_file, target_path, request.visualize)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"OCR Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    return ORJSONResponse({
+        "success": True,
+        "results": results,
+        "vis_image_url": vis_image_url
+    }, option=orjson.OPT_SERIALIZE_NUMPY)
+
 
 @router.get("/settings")
 async def get_settings():
     """Get subject mappings and other settings"""
-    mapping_file = os.path.join(os.getcwd(), config.get_subject_mappings_file())
-    if os.path.exists(mapping_file):
-        with open(mapping_file, 'r', encoding='utf-8') as f:
-            mappings = json.load(f)
-    else:
-        mappings = {}
+    mappings = await asyncio.to_thread(_get_subject_mappings)
     return {"mappings": mappings}
 
 @router.post("/settings")
@@ -288,9 +652,16 @@ async def update_settings(settings: SettingsUpdate):
     """Update subject mappings"""
     mapping_file = os.path.join(os.getcwd(), config.get_subject_mappings_file())
     try:
-        with open(mapping_file, 'w', encoding='utf-8') as f:
-            json.dump(settings.mappings, f, ensure_ascii=False, indent=2)
-        # Force config reload if needed, or just reload the specific mapping in memory if we cached it
+        await asyncio.to_thread(_save_json, mapping_file, settings.mappings)
+        # Prime the cache with what we just wrote so the next capture doesn't re-parse it
+        try:
+            mtime = os.stat(mapping_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        with _mapping_lock:
+            _mapping_cache["value"] = settings.mappings
+            _mapping_cache["by_id"] = _index_mappings(settings.mappings)
+            _mapping_cache["mtime"] = mtime
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -298,83 +669,164 @@ async def update_settings(settings: SettingsUpdate):
 @router.get("/history")
 async def get_history():
     """Get list of captured images"""
-    return glob_captures()
+    return await asyncio.to_thread(glob_captures)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: "*", comma-separated lists and weak (W/) tags"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
 
 @router.get("/captures/{filename:path}")
-async def get_capture_image(filename: str):
+async def get_capture_image(filename: str, request: Request):
     """Serve capture file"""
-    # Securely join path
-    file_path = os.path.abspath(os.path.join(CAPTURES_DIR, filename))
-    if not file_path.startswith(CAPTURES_DIR) or not os.path.exists(file_path):
+    # Securely join path (resolve symlinks/".." and require it to stay inside CAPTURES_DIR)
+    file_path = (CAPTURES_PATH / filename).resolve()
+    if not file_path.is_relative_to(CAPTURES_PATH):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        stat_result = file_path.stat()
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+
+    # Captured images are written once, so the browser may cache them. Anything
+    # else here (OCR overlays, JSON) is rewritten in place and must revalidate.
+    name = file_path.name
+    immutable = name.startswith("capture_") and name.endswith(".jpg") and not name.endswith("_ocr.jpg")
+    headers = {
+        "Cache-Control": "public, max-age=86400" if immutable else "no-cache",
+        "ETag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    # Pass the stat result and media type so FileResponse skips its own
+    # stat call and content-type guessing.
+    return FileResponse(
+        file_path,
+        stat_result=stat_result,
+        media_type=_MEDIA_TYPES.get(file_path.suffix.lower()),
+        headers=headers,
+    )
+
+# Per-directory capture index: path -> (mtime_ns, captures in that directory).
+# Only directories whose mtime changed (file added/removed) are rescanned.
+_dir_index = {}
+_history_lock = threading.Lock()
+
+_IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.json': 'application/json',
+}
+_SKIP_SUFFIXES = ('_ocr.jpg', '_original.jpg')
 
 def glob_captures():
     """Helper to list captures sorted by date desc"""
-    files = []
     if not os.path.exists(CAPTURES_DIR):
         return []
 
-    # Walk through directory
-    for root, dirs, files_in_dir in os.walk(CAPTURES_DIR):
-        for f in files_in_dir:
-            if f.lower().endswith(('.jpg', '.jpeg', '.png')) and not f.endswith('_ocr.jpg') and not f.endswith('_original.jpg'):
-                full_path = os.path.join(root, f)
-                # Get relative path for URL (e.g., "Math/capture.jpg")
-                rel_path = os.path.relpath(full_path, CAPTURES_DIR)
-                # URL encode path segments
-                url_path = "/".join([p for p in rel_path.split(os.sep)])
-
-                stats = os.stat(full_path)
-
-                # Check for metadata
-                base_name = os.path.splitext(f)[0]
-                info_path = os.path.join(root, f"{base_name}_info.json")
-                detected_id = None
-                if os.path.exists(info_path):
-                    try:
-                        with open(info_path, 'r') as meta_f:
-                            meta = json.load(meta_f)
-                            detected_id = meta.get("detected_id")
-                    except:
-                        pass
-
-                # Check for original image
-                base_name = os.path.splitext(f)[0]
-                original_filename = f"{base_name}_original.jpg" # Assuming jpg
-                original_path = os.path.join(root, original_filename)
-                url_original = None
-                if os.path.exists(original_path):
-                     rel_path_orig = os.path.relpath(original_path, CAPTURES_DIR)
-                     url_path_orig = "/".join([p for p in rel_path_orig.split(os.sep)])
-                     url_original = f"/api/captures/{url_path_orig}"
-
-                files.append({
-                    "filename": f,
-                    "filepath": full_path,
-                    "created_at": datetime.fromtimestamp(stats.st_mtime).isoformat(),
-                    "url": f"/api/captures/{url_path}",
-                    "url_original": url_original,
-                    "subject": os.path.basename(root) if root != CAPTURES_DIR else "Unclassified",
-                    "detected_id": detected_id,
-                    "relative_path": url_path # For API calls needing path
-                })
+    files = []
+    with _history_lock:
+        seen = set()
+        stack = [CAPTURES_DIR]
+        while stack:
+            root = stack.pop()
+            try:
+                mtime = os.stat(root).st_mtime_ns
+                with os.scandir(root) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            seen.add(root)
+            stack.extend(e.path for e in entries if e.is_dir())
+
+            cached = _dir_index.get(root)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, _scan_dir(root, entries))
+                _dir_index[root] = cached
+            files.extend(cached[1])
+
+        # Forget directories that no longer exist
+        for root in list(_dir_index):
+            if root not in seen:
+                del _dir_index[root]
 
     # Sort by mtime desc
     files.sort(key=lambda x: x['created_at'], reverse=True)
     return files
 
+def _scan_dir(root: str, entries: list) -> list:
+    """Build the capture list for one directory from its scandir entries"""
+    files = []
+
+    # Names in this directory, for metadata/original lookups without extra stats
+    names = {e.name for e in entries}
+    rel_root = os.path.relpath(root, CAPTURES_DIR)
+    # URL path prefix (e.g., "Math/")
+    url_prefix = "" if rel_root == "." else "/".join(rel_root.split(os.sep)) + "/"
+    subject = os.path.basename(root) if root != CAPTURES_DIR else "Unclassified"
+
+    for entry in entries:
+        if entry.is_dir():
+            continue
+
+        f = entry.name
+        if not f.lower().endswith(_IMAGE_EXTS) or f.endswith(_SKIP_SUFFIXES):
+            continue
+
+        # Relative path for URL (e.g., "Math/capture.jpg")
+        url_path = url_prefix + f
+        stats = entry.stat()
+        base_name = os.path.splitext(f)[0]
+
+        # Check for metadata
+        detected_id = None
+        info_name = f"{base_name}_info.json"
+        if info_name in names:
+            try:
+                meta = _load_json(os.path.join(root, info_name))
+                detected_id = meta.get("detected_id")
+            except:
+                pass
+
+        # Check for original image
+        original_filename = f"{base_name}_original.jpg" # Assuming jpg
+        url_original = None
+        if original_filename in names:
+            url_original = f"/api/captures/{url_prefix}{original_filename}"
+
+        files.append({
+            "filename": f,
+            "filepath": entry.path,
+            "created_at": datetime.fromtimestamp(stats.st_mtime).isoformat(),
+            "url": f"/api/captures/{url_path}",
+            "url_original": url_original,
+            "subject": subject,
+            "detected_id": detected_id,
+            "relative_path": url_path # For API calls needing path
+        })
+    return files
+
 def manual_trigger_auto_capture(frame: np.ndarray, detected_ids: List[int] = [], detected_corners: List[Any] = []):
     """Callback for auto-capture from CameraManager"""
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = _capture_timestamp()
 
-        # Load mappings
-        mapping_file = os.path.join(os.getcwd(), config.get_subject_mappings_file())
-        subject_mappings = {}
-        if os.path.exists(mapping_file):
-            with open(mapping_file, 'r', encoding='utf-8') as f:
-                subject_mappings = json.load(f)
+        # Load mappings (keyed by int marker id)
+        _, subject_ids = _load_subject_mappings()
 
         # Determine subject
         target_dir = CAPTURES_DIR # Default to root/Unclassified effectively
@@ -384,9 +836,8 @@ def manual_trigger_auto_capture(frame: np.ndarray, detected_ids: List[int] = [],
         # Check detected IDs
         # Priority: First mapped ID found
         for mid in detected_ids:
-            str_id = str(mid)
-            if str_id in subject_mappings:
-                subject_name = subject_mappings[str_id]
+            if mid in subject_ids:
+                subject_name = subject_ids[mid]
                 target_dir = os.path.join(CAPTURES_DIR, subject_name)
                 break
             else:
@@ -401,10 +852,8 @@ def manual_trigger_auto_capture(frame: np.ndarray, detected_ids: List[int] = [],
         filename = f"capture_{timestamp}.jpg"
         filepath = os.path.join(target_dir, filename)
 
-        # Save Original Image
         original_filename = f"capture_{timestamp}_original.jpg"
         original_filepath = os.path.join(target_dir, original_filename)
-        cv2.imwrite(original_filepath, frame)
 
         # --- Image Processing with Green Background Detection ---
         processing_frame, success = process_with_green_background(frame, enhance=True)
@@ -415,28 +864,38 @@ def manual_trigger_auto_capture(frame: np.ndarray, detected_ids: List[int] = [],
             print(f"[GreenDetect] Paper detection failed, using enhanced original")
 
         # Resize if too large
-        max_dim = 2000
-        h, w = processing_frame.shape[:2]
-        if h > max_dim or w > max_dim:
-            scale = max_dim / max(h, w)
-            processing_frame = cv2.resize(processing_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-
-        # Save image
-        cv2.imwrite(filepath, processing_frame)
-        print(f"Auto-saved to: {filepath} (Subject: {subject_name})")
+        processing_frame = resize_to_max_dim(processing_frame, 2000)
+
+        # Save original + processed image (+ metadata) together
+        outputs = [
+            (original_filepath, frame),
+            (filepath, processing_frame),
+        ]
 
         # Save Metadata if Unclassified and has ID
         if subject_name == "Unclassified" and detected_id is not None:
              meta_filename = f"capture_{timestamp}_info.json"
              meta_path = os.path.join(target_dir, meta_filename)
-             with open(meta_path, 'w', encoding='utf-8') as f:
-                 json.dump({"detected_id": int(detected_id)}, f)
+             outputs.append((meta_path, {"detected_id": int(detected_id)}))
+
+        _save_capture_files(outputs)
+        print(f"Auto-saved to: {filepath} (Subject: {subject_name})")
 
-        # Trigger background OCR
-        threading.Thread(target=perform_ocr_background, args=(filepath,), daemon=True).start()
+        # Trigger background OCR only after the save succeeded, since its JSON
+        # belongs next to the capture; the in-memory image skips re-reading it
+        submit_ocr(filepath, processing_frame)
 
     except Exception as e:
         print(f"Auto-capture callback failed: {e}")
 
+# Auto-capture processing/saving runs here instead of on the camera thread,
+# so encoding and disk writes don't stall frame capture
+_capture_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture-writer")
+
+def _on_auto_capture(frame: np.ndarray, detected_ids: List[int], detected_corners: List[Any]):
+    """Called from the camera thread; queue the capture for the writer thread"""
+    # Frames from CameraManager are read-only and never reused, so no copy is needed
+    _capture_pool.submit(manual_trigger_auto_capture, frame, detected_ids, detected_corners)
+
 # Register callback
-camera_manager.set_capture_callback(manual_trigger_auto_capture)
+camera_manager.set_capture_callback(_on_auto_capture)
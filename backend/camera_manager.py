@@ -1,7 +1,8 @@
+import asyncio
 import cv2
 import threading
 import time
-from typing import Optional, Generator
+from typing import Optional, AsyncGenerator, Tuple
 import numpy as np
 import os
 import sys
@@ -11,14 +12,95 @@ if __name__ == "__main__":
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from config_loader import get_config
+from image_processing import encode_jpeg
 import cv2.aruco as aruco
 
+# Numba (optional) compiles the per-marker filter loop; otherwise NumPy vectorizes it
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def pin_current_thread(cores) -> None:
+    """Restrict the calling thread to the given CPU cores (Linux only, no-op otherwise)"""
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        # pid 0 applies to the calling thread only
+        os.sched_setaffinity(0, set(cores))
+    except OSError as e:
+        print(f"Failed to set CPU affinity {cores}: {e}")
+
+# Vertex orderings whose polygon areas bound the convex hull of 4 points:
+# the three distinct quads, then the four triangles (a point inside the other three)
+_QUAD_ORDERS = np.array([[0, 1, 2, 3], [0, 1, 3, 2], [0, 2, 1, 3]])
+_TRIANGLES = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+
+
+def _shoelace(p: np.ndarray) -> np.ndarray:
+    x, y = p[..., 0], p[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+
+
+def _marker_keep_mask_numpy(pts, min_area, fill_threshold, quads, tris):
+    """Keep-mask for (N, 4, 2) marker corners, vectorized over markers"""
+    area = _shoelace(pts)
+    hull = area
+    for order in quads[1:]:
+        hull = np.maximum(hull, _shoelace(pts[:, order]))
+    for tri in tris:
+        hull = np.maximum(hull, _shoelace(pts[:, tri]))
+    return (area >= min_area) & (area >= fill_threshold * hull)
+
+
+def _marker_keep_mask_loop(pts, min_area, fill_threshold, quads, tris):
+    """Same as _marker_keep_mask_numpy as plain loops, for Numba to compile"""
+    n = pts.shape[0]
+    keep = np.empty(n, dtype=np.bool_)
+    for i in range(n):
+        area = 0.0
+        hull = 0.0
+        for orders in (quads, tris):
+            k = orders.shape[1]
+            for o in range(orders.shape[0]):
+                s = 0.0
+                for j in range(k):
+                    a = orders[o, j]
+                    b = orders[o, (j + 1) % k]
+                    s += pts[i, a, 0] * pts[i, b, 1] - pts[i, b, 0] * pts[i, a, 1]
+                s = 0.5 * abs(s)
+                if k == 4 and o == 0:
+                    area = s
+                hull = max(hull, s)
+        keep[i] = area >= min_area and area >= fill_threshold * hull
+    return keep
+
+
+_marker_keep_mask = (
+    njit(cache=True)(_marker_keep_mask_loop) if njit is not None else _marker_keep_mask_numpy
+)
+
 class CameraManager:
     def __init__(self):
         self.cap: Optional[cv2.VideoCapture] = None
         self.lock = threading.Lock()
         self.config = get_config()
+        # Cap OpenCV's internal thread pool so it doesn't steal cores from OCR
+        opencv_threads = self.config.get_opencv_threads()
+        if opencv_threads > 0:
+            cv2.setNumThreads(opencv_threads)
         self.current_frame: Optional[np.ndarray] = None
+        # ArUco result for current_frame: (corners, ids), shared with the stream
+        self.latest_detection: Tuple[tuple, Optional[np.ndarray]] = ((), None)
+        self.frame_seq = 0 # Incremented for every new frame
+
+        # Latest stream JPEG (frame_seq, bytes), shared by all MJPEG clients
+        self._stream_jpeg: Tuple[int, bytes] = (-1, b"")
+        self._stream_lock = threading.Lock()
+        self.stream_max_width = self.config.get_stream_max_width()
+        self.stream_jpeg_quality = self.config.get_stream_jpeg_quality()
+        self._preview_buf: Optional[np.ndarray] = None # Reused resize target, guarded by _stream_lock
         self.camera_paused = False
         self.white_balance_enabled = self.config.get_white_balance_enabled_by_default()
 
@@ -28,8 +110,28 @@ class CameraManager:
         self.aruco_dict = aruco.getPredefinedDictionary(dict_type)
         params = aruco.DetectorParameters()
         self.detector = aruco.ArucoDetector(self.aruco_dict, params)
-
-        # Auto-capture state
+        self.detection_scale = self.config.get_aruco_detection_scale()
+        # Marker confidence filter (see config.yaml)
+        self.area_ratio_threshold = self.config.get_aruco_area_ratio_threshold()
+        self.fill_threshold = self.config.get_aruco_fill_threshold()
+        # Run grayscale + resize on the GPU via OpenCV's T-API (UMat) if enabled
+        self.use_opencl = self.config.get_aruco_use_opencl() and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+        self.last_marker_seen = 0.0 # Last time any marker was detected
+        # Detection buffers reused across frames (capture thread only)
+        self._gray_buf: Optional[np.ndarray] = None
+        self._small_buf: Optional[np.ndarray] = None
+        # Run detection on one frame in detect_interval; the others reuse the last result
+        self.detect_interval = max(1, self.config.get_aruco_detect_interval())
+        self._frame_counter = 0
+        self._last_detection = ((), None)
+        # Set while OCR inference runs; detection then backs off to leave it the CPU
+        self.ocr_busy = False
+
+        # Auto-capture state (timings read once; checked on every frame)
+        self.auto_capture_delay_ms = self.config.get_auto_capture_delay_ms()
+        self.capture_cooldown_ms = self.config.get_capture_cooldown_ms()
         self.last_marker_time = 0.0
         self.auto_capture_triggered = False
         self.on_capture_callback = None
@@ -37,17 +139,27 @@ class CameraManager:
         self.current_progress = 0.0 # For progress bar visualization
         self.cooldown_end_time = 0.0 # Cooldown period after capture
 
+        # asyncio listeners: {asyncio.Event: loop}, woken from the capture thread
+        self._status_listeners = {} # Set when progress/triggered change
+        self._frame_listeners = {} # Set on every new frame
+        self._listeners_lock = threading.Lock()
+
         # Threading support
         self.running = False
         self.thread = None
+        self._stop_event = threading.Event() # Wakes the capture thread's retry wait on stop
 
     def initialize(self):
         """Initialize the camera based on config"""
         # Similar logic to main.py try_open_capture
-        def try_open_capture(source, tries=3):
-            cap = cv2.VideoCapture(source)
+        def try_open_capture(source, tries=3, api=cv2.CAP_ANY, props=()):
+            cap = cv2.VideoCapture(source, api)
             if not cap.isOpened():
                 return None
+            # Apply format settings before the first read so the driver
+            # negotiates once instead of restarting the stream afterwards
+            for prop, value in props:
+                cap.set(prop, value)
             for _ in range(tries):
                 ret, _ = cap.read()
                 if ret:
@@ -63,9 +175,20 @@ class CameraManager:
 
         if self.cap is None:
             print(f"Attempting to open local camera: {self.config.get_local_device_index()}")
+            props = []
+            # USB cameras usually deliver higher frame rates as MJPG than raw YUYV
+            fourcc = self.config.get_local_fourcc()
+            if fourcc:
+                props.append((cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc)))
+            if self.config.get_local_width() > 0:
+                props.append((cv2.CAP_PROP_FRAME_WIDTH, self.config.get_local_width()))
+            if self.config.get_local_height() > 0:
+                props.append((cv2.CAP_PROP_FRAME_HEIGHT, self.config.get_local_height()))
             self.cap = try_open_capture(
                 self.config.get_local_device_index(),
                 tries=self.config.get_network_retry_count(),
+                api=self._local_capture_api(),
+                props=props,
             )
 
         if self.cap is None:
@@ -74,41 +197,154 @@ class CameraManager:
         self.cap.set(cv2.CAP_PROP_BUFFERSIZE, self.config.get_buffer_size())
         print("Camera initialized successfully")
 
+        # Compile (or load the cached) marker filter now, not on the first detection
+        _marker_keep_mask(np.zeros((1, 4, 2), dtype=np.float32), 0.0, 0.0, _QUAD_ORDERS, _TRIANGLES)
+
         # Start background thread
         self.start_capture_thread()
 
+    @staticmethod
+    def _local_capture_api() -> int:
+        """Native capture backend for this OS, so OpenCV doesn't probe every backend"""
+        if sys.platform.startswith("linux"):
+            return cv2.CAP_V4L2
+        if sys.platform == "win32":
+            return cv2.CAP_DSHOW
+        return cv2.CAP_ANY
+
     def start_capture_thread(self):
         if self.running:
             return
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.thread.start()
 
     def stop_capture_thread(self):
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=2.0)
 
     def _capture_loop(self):
         """Continuous capture and processing loop"""
+        pin_current_thread(self.config.get_camera_cpu_affinity())
         while self.running and self.cap:
-            ret, frame = self.cap.read()
+            ret, frame = self._read_latest()
             if not ret:
-                # Try to reconnect or just wait
-                time.sleep(0.1)
+                # Camera not ready; retry shortly, but return at once on stop
+                self._stop_event.wait(0.1)
                 continue
 
+            # Detect markers once per frame; the stream reuses this result
+            corners, ids = self.detect_markers(frame)
+
+            # Publish the frame read-only; read/retrieve allocate a new array
+            # every time, so consumers can share it without copying
+            frame.flags.writeable = False
+
             # Update current frame safely
             with self.lock:
-                self.current_frame = frame.copy()
+                self.current_frame = frame
+                self.latest_detection = (corners, ids)
+                self.frame_seq += 1
+            self._notify(self._frame_listeners)
 
             # Run auto-capture logic immediately
-            self.check_auto_capture(frame)
+            self.check_auto_capture(frame, corners, ids)
+
+    def _read_latest(self, max_drop: int = 4):
+        """Read a frame, dropping frames the backend had already buffered.
+
+        A grab() that returns almost immediately was served from the buffer
+        (stale), so keep grabbing until one actually waits for the camera.
+        When the loop keeps up, the very first grab already waits and its
+        frame is used as is.
+        """
+        for _ in range(max_drop + 1):
+            start = time.perf_counter()
+            if not self.cap.grab():
+                # Nothing valid to retrieve after a failed grab
+                return False, None
+            if time.perf_counter() - start > 0.005:
+                break
+        return self.cap.retrieve()
+
+    def detect_markers(self, frame: np.ndarray):
+        """Run ArUco detection on a frame; returns (corners, ids) in frame coordinates"""
+        # Only detect on every Nth frame (at least every other one while no
+        # marker has been seen for 500ms); auto-capture timing is far coarser
+        now = time.time()
+        idle = now - self.last_marker_seen > 0.5
+        interval = max(self.detect_interval, 2) if idle else self.detect_interval
+        if self.ocr_busy:
+            interval *= 2
+        self._frame_counter += 1
+        if self._frame_counter % interval:
+            return ((), None) if idle else self._last_detection
 
-            # Rate limit slightly to avoid 100% CPU if camera is very fast
-            # But usually cap.read() blocks until frame is ready.
+        try:
+            # Detect on a downscaled image (keep at least 640px wide)
+            scale = self.detection_scale
+            h, w = frame.shape[:2]
+            if not (scale < 1.0 and w * scale >= 640):
+                scale = 1.0
+
+            small_size = (int(w * scale), int(h * scale))
+            # The green channel is a good luma proxy for black-and-white
+            # markers, and copying it out is cheaper than a weighted BGR->gray
+            if self.use_opencl:
+                gray = cv2.extractChannel(cv2.UMat(frame), 1)
+                if scale != 1.0:
+                    gray = cv2.resize(gray, small_size, interpolation=cv2.INTER_AREA)
+                # Only this preprocessing runs on OpenCL. Download before detection:
+                # given a UMat, the binding returns corners/ids as UMats too
+                gray = gray.get()
+            else:
+                if self._gray_buf is None or self._gray_buf.shape != (h, w):
+                    self._gray_buf = np.empty((h, w), dtype=np.uint8)
+                gray = cv2.extractChannel(frame, 1, dst=self._gray_buf)
+                if scale != 1.0:
+                    if self._small_buf is None or self._small_buf.shape != small_size[::-1]:
+                        self._small_buf = np.empty(small_size[::-1], dtype=np.uint8)
+                    gray = cv2.resize(gray, small_size, dst=self._small_buf, interpolation=cv2.INTER_AREA)
+
+            corners, ids, _ = self.detector.detectMarkers(gray)
+            corners, ids = self.filter_markers(corners, ids, h * w, 1.0 / scale)
+
+            if ids is not None and len(ids) > 0:
+                self.last_marker_seen = now
+            self._last_detection = (corners, ids)
+            return corners, ids
+        except Exception as e:
+            print(f"Error in marker detection: {e}")
+            return (), None
+
+    def filter_markers(self, corners, ids, image_area: float, rescale: float = 1.0):
+        """Drop implausible detections: too small, or too far from a convex quad.
+
+        Polygon area via the shoelace formula, convex hull area as the largest
+        of the three 4-point orderings and the four triangles (covers a point
+        lying inside the other three). Corners are stacked into one (N, 4, 2)
+        array, scaled by rescale (detection ran on a downscaled image) and
+        masked there; the kept rows are returned as (1, 4, 2) views of it.
+        """
+        if ids is None or len(ids) == 0:
+            return (), None
+
+        pts = np.concatenate(corners).reshape(-1, 4, 2)  # new float32 array
+        if rescale != 1.0:
+            pts *= rescale
+        keep = _marker_keep_mask(
+            pts, self.area_ratio_threshold * image_area, self.fill_threshold, _QUAD_ORDERS, _TRIANGLES
+        )
+        if not keep.all():
+            if not keep.any():
+                return (), None
+            pts, ids = pts[keep], ids[keep]
+        return tuple(pts.reshape(-1, 1, 4, 2)), ids
 
-    def check_auto_capture(self, frame):
+    def check_auto_capture(self, frame, corners, ids):
         """Check markers and trigger capture if stable"""
         try:
             cur_time = time.time()
@@ -116,48 +352,83 @@ class CameraManager:
             # Check if in cooldown period
             if cur_time < self.cooldown_end_time:
                 # During cooldown, reset state and skip detection
-                self.current_progress = 0.0
-                self.auto_capture_triggered = False
+                self._update_status(0.0, False)
                 self.last_marker_time = 0
                 return
 
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            corners, ids, _ = self.detector.detectMarkers(gray)
-
             if ids is not None and len(ids) > 0:
                 if self.last_marker_time == 0:
                     self.last_marker_time = cur_time
 
                 # Check duration
                 elapsed = (cur_time - self.last_marker_time) * 1000
-                if elapsed >= self.config.get_auto_capture_delay_ms():
-                    self.current_progress = 1.0
+                if elapsed >= self.auto_capture_delay_ms:
                     if not self.auto_capture_triggered:
                         print(f"Auto-capture triggered! (stable for {elapsed:.0f}ms)")
-                        self.auto_capture_triggered = True
+                        self._update_status(1.0, True)
                         self.capture_flash_time = cur_time
 
                         if self.on_capture_callback:
                             detected_ids = ids.flatten().tolist() if ids is not None else []
                             detected_corners = [c.tolist() for c in corners] if corners else []
-                            self.on_capture_callback(frame.copy(), detected_ids, detected_corners)
+                            self.on_capture_callback(frame, detected_ids, detected_corners)
 
                         # Start cooldown period
-                        cooldown_ms = self.config.get_capture_cooldown_ms()
-                        self.cooldown_end_time = cur_time + (cooldown_ms / 1000.0)
+                        self.cooldown_end_time = cur_time + (self.capture_cooldown_ms / 1000.0)
                 else:
                     # Update progress
-                    self.current_progress = elapsed / self.config.get_auto_capture_delay_ms()
-                    self.auto_capture_triggered = False
+                    self._update_status(elapsed / self.auto_capture_delay_ms, False)
             else:
                 self.last_marker_time = 0
-                self.current_progress = 0.0
-                self.auto_capture_triggered = False
+                self._update_status(0.0, False)
 
         except Exception as e:
             print(f"Error in auto-capture logic: {e}")
 
 
+    def _update_status(self, progress: float, triggered: bool):
+        """Update capture status and wake SSE listeners if it changed"""
+        if progress == self.current_progress and triggered == self.auto_capture_triggered:
+            return
+        self.current_progress = progress
+        self.auto_capture_triggered = triggered
+        self._notify(self._status_listeners)
+
+    def _notify(self, listeners: dict):
+        """Set every registered asyncio.Event from this (non-loop) thread"""
+        with self._listeners_lock:
+            items = list(listeners.items())
+        for event, loop in items:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _subscribe(self, listeners: dict) -> asyncio.Event:
+        event = asyncio.Event()
+        with self._listeners_lock:
+            listeners[event] = asyncio.get_running_loop()
+        return event
+
+    def _unsubscribe(self, listeners: dict, event: asyncio.Event):
+        with self._listeners_lock:
+            listeners.pop(event, None)
+
+    def subscribe_status(self) -> asyncio.Event:
+        """Register an asyncio.Event (on the running loop) set on status change"""
+        return self._subscribe(self._status_listeners)
+
+    def unsubscribe_status(self, event: asyncio.Event):
+        self._unsubscribe(self._status_listeners, event)
+
+    def subscribe_frames(self) -> asyncio.Event:
+        """Register an asyncio.Event (on the running loop) set on every new frame"""
+        return self._subscribe(self._frame_listeners)
+
+    def unsubscribe_frames(self, event: asyncio.Event):
+        self._unsubscribe(self._frame_listeners, event)
+
     def release(self):
         self.stop_capture_thread()
         if self.cap:
@@ -165,55 +436,79 @@ class CameraManager:
             self.cap = None
 
     def get_frame(self) -> Optional[np.ndarray]:
+        """Latest frame (read-only; copy it before modifying)"""
         with self.lock:
-            if self.current_frame is None:
-                return None
-            return self.current_frame.copy()
-
-    def process_frame_for_stream(self, frame: np.ndarray) -> bytes:
-        """Process frame (ArUco, WB, etc) and return JPEG bytes"""
-        # Copy to avoid modifying the original for other uses if needed
-        display_frame = frame.copy()
-
-        # Resize for streaming (max 800px width for performance)
-        h, w = display_frame.shape[:2]
-        max_width = 800
-        if w > max_width:
-            scale = max_width / w
-            display_frame = cv2.resize(display_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
-
-        # ArUco detection on resized frame
-        gray = cv2.cvtColor(display_frame, cv2.COLOR_BGR2GRAY)
-        corners, ids, _ = self.detector.detectMarkers(gray)
+            return self.current_frame
 
-        if ids is not None and len(ids) > 0:
+    def get_stream_jpeg(self) -> Tuple[int, bytes]:
+        """Return (frame_seq, JPEG) for the latest frame, encoding it once for all clients"""
+        with self._stream_lock:
+            with self.lock:
+                seq = self.frame_seq
+                if self.current_frame is None or self._stream_jpeg[0] == seq:
+                    return self._stream_jpeg
+                frame = self.current_frame
+                corners, ids = self.latest_detection
+
+            self._stream_jpeg = (seq, self.process_frame_for_stream(frame, corners, ids))
+            return self._stream_jpeg
+
+    def process_frame_for_stream(self, frame: np.ndarray, corners=(), ids=None) -> bytes:
+        """Draw the capture thread's ArUco result on the frame and return JPEG bytes"""
+        # Resize for streaming (capped width; the full-res frame is kept for captures)
+        h, w = frame.shape[:2]
+        max_width = self.stream_max_width
+        scale = max_width / w if w > max_width else 1.0
+        draw_markers = ids is not None and len(ids) > 0
+
+        if scale == 1.0 and not draw_markers:
+            # Nothing to change; encode the shared read-only frame without copying
+            return encode_jpeg(frame, self.stream_jpeg_quality, fast=True)
+
+        # Draw into a buffer reused across frames (frames themselves are read-only)
+        shape = (int(h * scale), min(w, max_width)) + frame.shape[2:]
+        buf = self._preview_buf
+        if buf is None or buf.shape != shape or buf.dtype != frame.dtype:
+            buf = self._preview_buf = np.empty(shape, dtype=frame.dtype)
+        if scale != 1.0 and self.use_opencl:
+            # Downscale on the GPU; only the small preview is copied back
+            small = cv2.resize(cv2.UMat(frame), (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+            np.copyto(buf, small.get())
+            display_frame = buf
+        elif scale != 1.0:
+            # INTER_AREA avoids aliasing, so the preview also compresses smaller
+            display_frame = cv2.resize(frame, (shape[1], shape[0]), dst=buf, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(buf, frame)
+            display_frame = buf
+
+        # Markers were detected on the full-size frame; scale corners to match
+        if draw_markers:
+            if scale != 1.0:
+                corners = tuple(c * scale for c in corners)
             aruco.drawDetectedMarkers(display_frame, corners, ids)
 
         # JPEG encoding with lower quality for faster streaming
-        encode_params = [cv2.IMWRITE_JPEG_QUALITY, 65]
-        ret, buffer = cv2.imencode('.jpg', display_frame, encode_params)
-        if not ret:
-            return b""
-        return buffer.tobytes()
-
-    def generate_stream(self) -> Generator[bytes, None, None]:
-        """Generator for MJPEG stream"""
-        while True:
-            frame = self.get_frame()
-            if frame is None:
-                time.sleep(0.05)
-                continue
-
-            jpeg_bytes = self.process_frame_for_stream(frame)
-            if not jpeg_bytes:
-                continue
-
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
-
-            # Minimal sleep to allow other tasks (target ~30fps)
-            time.sleep(0.01)
+        return encode_jpeg(display_frame, self.stream_jpeg_quality, fast=True)
 
+    async def generate_stream(self) -> AsyncGenerator[bytes, None]:
+        """Async generator for MJPEG stream; sends each new frame once"""
+        frame_event = self.subscribe_frames()
+        last_seq = -1
+        try:
+            while True:
+                # Encoding is CPU work, keep it off the event loop
+                seq, jpeg_bytes = await asyncio.to_thread(self.get_stream_jpeg)
+                if jpeg_bytes and seq != last_seq:
+                    last_seq = seq
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+                # Wait for the capture thread to publish the next frame
+                await frame_event.wait()
+                frame_event.clear()
+        finally:
+            self.unsubscribe_frames(frame_event)
 
     def set_capture_callback(self, callback):
         self.on_capture_callback = callback
@@ -1,8 +1,184 @@
 
 from google import genai
+from google.genai import types
+import asyncio
+import hashlib
 import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+import numpy as np
 from config_loader import get_config
 
+
+class SemanticCache:
+    """LRU cache of LLM answers keyed by the question text.
+
+    Entries are scoped by kind ("explain", "problem", "chat") and a hash of the
+    rest of the prompt (document context, chat history). Within a scope exact
+    repeats (after NFKC/whitespace normalization) always hit. Near-duplicate
+    matching is opt-in: with model_name set and sentence-transformers
+    installed, entries also hit when their cosine similarity >= threshold.
+    The model must handle Japanese, or unrelated passages can score as
+    similar and get each other's answers.
+
+    With db_path set, every answer is also stored in SQLite: the most recently
+    used max_entries are loaded back on startup, and exact repeats of older
+    entries are still found there.
+    """
+
+    def __init__(self, model_name: str, threshold: float = 0.9, max_entries: int = 256, db_path: str = None):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # None: not loaded yet, False: exact matching only (no model configured,
+        # or sentence-transformers unavailable)
+        self._model = None if model_name else False
+        self._model_lock = threading.Lock()
+        # (scope, normalized text) -> (unit vector or None, response)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "scope TEXT NOT NULL, text TEXT NOT NULL, response TEXT NOT NULL,"
+                    "embedding BLOB, used_at REAL NOT NULL, PRIMARY KEY (scope, text))"
+                )
+                self._db.commit()
+                self._load_recent()
+            except sqlite3.Error as e:
+                print(f"LLM cache DB unavailable, using memory only: {e}")
+                self._db = None
+
+    def _load_recent(self) -> None:
+        rows = self._db.execute(
+            "SELECT scope, text, response, embedding FROM cache ORDER BY used_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        # Oldest first so the most recent end up at the MRU end
+        for scope, text, response, blob in reversed(rows):
+            vector = np.frombuffer(blob, dtype=np.float32) if blob else None
+            self._entries[(scope, text)] = (vector, response)
+
+    def _db_lookup(self, key: tuple) -> Optional[tuple]:
+        """Exact lookup of an entry no longer in memory (caller holds _lock)"""
+        row = self._db.execute(
+            "SELECT response, embedding FROM cache WHERE scope = ? AND text = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE cache SET used_at = ? WHERE scope = ? AND text = ?", (time.time(), *key))
+        self._db.commit()
+        vector = np.frombuffer(row[1], dtype=np.float32) if row[1] else None
+        return vector, row[0]
+
+    def _remember(self, key: tuple, entry: tuple) -> None:
+        """Insert into the in-memory LRU (caller holds _lock)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    @staticmethod
+    def _scope(kind: str, scope: str) -> str:
+        return kind + ":" + hashlib.blake2b(scope.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _load_model(self):
+        # Optional dependency, imported on first use (it pulls in torch)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            return False
+        return SentenceTransformer(self.model_name)
+
+    def _encode(self, text: str) -> Optional[np.ndarray]:
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        if self._model is False:
+            return None
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def get(self, kind: str, text: str, scope: str = "") -> Optional[str]:
+        """Return a cached answer for the same or a similar question, or None"""
+        scope_key = self._scope(kind, scope)
+        key = (scope_key, self._normalize(text))
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                return hit[1]
+            if self._db is not None:
+                try:
+                    hit = self._db_lookup(key)
+                except sqlite3.Error as e:
+                    print(f"LLM cache DB lookup failed: {e}")
+                if hit is not None:
+                    self._remember(key, hit)
+                    return hit[1]
+            candidates = [(k, v) for k, (v, _) in self._entries.items() if k[0] == scope_key and v is not None]
+        if not candidates:
+            return None
+
+        query = self._encode(key[1])
+        if query is None:
+            return None
+        scores = np.stack([v for _, v in candidates]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        with self._lock:
+            entry = self._entries.get(candidates[best][0])
+            return entry[1] if entry is not None else None
+
+    def put(self, kind: str, text: str, scope: str, response: str) -> None:
+        """Store an answer; evicts the least recently used entries beyond max_entries"""
+        key = (self._scope(kind, scope), self._normalize(text))
+        vector = self._encode(key[1])
+        with self._lock:
+            self._remember(key, (vector, response))
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                        (*key, response, vector.tobytes() if vector is not None else None, time.time()),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"LLM cache DB write failed: {e}")
+
+
+# Fixed instructions, sent as system_instruction. They never contain per-call
+# data so they stay a byte-identical prefix that Gemini can cache; the document
+# context and question go into the contents, context first.
+EXPLAIN_SYSTEM = """あなたは親切な家庭教師です。学生がドキュメント内の特定の部分について質問しています。
+「質問対象のテキスト」について、ドキュメント全体の文脈を踏まえて、学生向けにわかりやすく簡潔に解説してください。
+専門用語が含まれる場合は、それらの定義も説明してください。テキストはOCRによって生成されたものであり、正確性は保証されません。誤字脱字は無視して、指摘しないでください。2行連続した改行は避けてください。
+**必ず日本語で回答してください。感情や人格を排し、事実のみを事務的に記述してください。余計な会話文は含めないでください。**"""
+
+PROBLEM_SYSTEM = """あなたは先生です。学生がドキュメント内の特定の部分について練習問題を求めています。
+「対象のテキスト」に関連する練習問題を、ドキュメント全体の文脈を踏まえて3問作成してください（選択式または記述式）。
+最後に解答を含めてください。テキストはOCRによって生成されたものであり、正確性は保証されません。誤字脱字は無視して、指摘しないでください。2行連続した改行は避けてください。
+**必ず日本語で回答してください。感情や人格を排し、事実のみを事務的に記述してください。余計な会話文は含めないでください。**"""
+
+CHAT_SYSTEM = """あなたは親切な家庭教師です。学生と会話をしています。
+これまでの会話の流れを踏まえて、学生の質問に答えてください。
+**必ず日本語で回答してください。簡潔に、わかりやすく答えてください。**"""
+
+
 class LLMService:
     def __init__(self):
         self.config = get_config()
@@ -18,55 +194,68 @@ class LLMService:
                 print(f"Failed to initialize Gemini Client: {e}")
                 self.mock_mode = True
 
-    def explain_text(self, text: str, context: str = None) -> str:
-        """Generate explanation for the given text"""
-        if self.mock_mode:
-            return f"[MOCK] Explanation for: {text}\n\nThis is a placeholder explanation because no API key was configured."
+        self.cache = None
+        if self.config.get_llm_cache_enabled():
+            self.cache = SemanticCache(
+                self.config.get_llm_cache_embedding_model(),
+                threshold=self.config.get_llm_cache_similarity_threshold(),
+                max_entries=self.config.get_llm_cache_max_entries(),
+                db_path=self._cache_db_path(),
+            )
 
-        context_section = ""
-        if context:
-            context_section = f"""
-【ドキュメント全体】
-{context}
+        self.max_retries = self.config.get_llm_max_retries()
+        self.max_backoff_s = self.config.get_llm_max_backoff_s()
+        # After a 429, calls wait until this time instead of firing doomed requests
+        self._cooldown_until = 0.0
 
-"""
+    def _cache_db_path(self) -> Optional[str]:
+        db_file = self.config.get_llm_cache_db_file()
+        if not db_file:
+            return None
+        # Relative paths are resolved next to config.yaml, not the process cwd
+        # (the server may be started from the repo root or from backend/)
+        config_dir = os.path.dirname(os.path.abspath(self.config.config_path))
+        return os.path.join(config_dir, db_file)
 
-        prompt = f"""あなたは親切な家庭教師です。学生がドキュメント内の特定の部分について質問しています。
-{context_section}【質問対象のテキスト】
-{text}
+    @staticmethod
+    def _chat_scope(history: list, context: str = None) -> str:
+        history_text = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
+        return f"{context or ''}\n{history_text}"
 
-上記の「質問対象のテキスト」について、ドキュメント全体の文脈を踏まえて、学生向けにわかりやすく簡潔に解説してください。
-専門用語が含まれる場合は、それらの定義も説明してください。テキストはOCRによって生成されたものであり、正確性は保証されません。誤字脱字は無視して、指摘しないでください。2行連続した改行は避けてください。
-**必ず日本語で回答してください。感情や人格を排し、事実のみを事務的に記述してください。余計な会話文は含めないでください。**"""
-        return self._generate(prompt)
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        error_str = str(error)
+        return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
 
-    def create_problems(self, text: str, context: str = None) -> str:
-        """Create practice problems based on the text"""
-        if self.mock_mode:
-            return f"[MOCK] Practice Problems for: {text}\n\n1. Question 1?\n2. Question 2?"
+    def _start_cooldown(self, attempt: int) -> float:
+        """Exponential backoff with jitter; shared by all calls through _cooldown_until"""
+        delay = min(2 ** attempt + random.uniform(0, 1), self.max_backoff_s)
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        return delay
 
-        context_section = ""
-        if context:
-            context_section = f"""
-【ドキュメント全体】
+    async def _wait_for_cooldown(self) -> None:
+        remaining = self._cooldown_until - time.monotonic()
+        if remaining > 0:
+            print(f"Rate limit cooldown. Waiting {remaining:.1f} seconds...")
+            await asyncio.sleep(remaining)
+
+    def _context_section(self, context: str = None) -> str:
+        if not context:
+            return ""
+        return f"""【ドキュメント全体】
 {context}
 
 """
 
-        prompt = f"""あなたは先生です。学生がドキュメント内の特定の部分について練習問題を求めています。
-{context_section}【対象のテキスト】
-{text}
+    def _explain_prompt(self, text: str, context: str = None) -> str:
+        return f"""{self._context_section(context)}【質問対象のテキスト】
+{text}"""
 
-上記の「対象のテキスト」に関連する練習問題を、ドキュメント全体の文脈を踏まえて3問作成してください（選択式または記述式）。
-最後に解答を含めてください。テキストはOCRによって生成されたものであり、正確性は保証されません。誤字脱字は無視して、指摘しないでください。2行連続した改行は避けてください。
-**必ず日本語で回答してください。感情や人格を排し、事実のみを事務的に記述してください。余計な会話文は含めないでください。**"""
-        return self._generate(prompt)
-
-    def chat(self, message: str, history: list, context: str = None) -> str:
-        """Continue a conversation with chat history"""
-        if self.mock_mode:
-            return f"[MOCK] Response to: {message}"
+    def _problems_prompt(self, text: str, context: str = None) -> str:
+        return f"""{self._context_section(context)}【対象のテキスト】
+{text}"""
 
+    def _chat_prompt(self, message: str, history: list, context: str = None) -> str:
         # Build conversation history
         history_text = ""
         for msg in history:
@@ -80,40 +269,106 @@ class LLMService:
 
 """
 
-        prompt = f"""あなたは親切な家庭教師です。学生と会話をしています。
-{context_section}【これまでの会話】
+        return f"""{context_section}【これまでの会話】
 {history_text}
-ユーザー: {message}
+ユーザー: {message}"""
 
-上記の会話の流れを踏まえて、学生の質問に答えてください。
-**必ず日本語で回答してください。簡潔に、わかりやすく答えてください。**"""
-        return self._generate(prompt)
+    async def explain_text(self, text: str, context: str = None) -> str:
+        """Generate explanation for the given text"""
+        if self.mock_mode:
+            return f"[MOCK] Explanation for: {text}\n\nThis is a placeholder explanation because no API key was configured."
+        return await self._generate(self._explain_prompt(text, context), EXPLAIN_SYSTEM, cache_key=("explain", text, context or ""))
+
+    async def create_problems(self, text: str, context: str = None) -> str:
+        """Create practice problems based on the text"""
+        if self.mock_mode:
+            return f"[MOCK] Practice Problems for: {text}\n\n1. Question 1?\n2. Question 2?"
+        return await self._generate(self._problems_prompt(text, context), PROBLEM_SYSTEM, cache_key=("problem", text, context or ""))
+
+    async def chat(self, message: str, history: list, context: str = None) -> str:
+        """Continue a conversation with chat history"""
+        if self.mock_mode:
+            return f"[MOCK] Response to: {message}"
+        return await self._generate(
+            self._chat_prompt(message, history, context),
+            CHAT_SYSTEM,
+            cache_key=("chat", message, self._chat_scope(history, context)),
+        )
 
-    def _generate(self, prompt: str, max_retries: int = 3) -> str:
-        import time
+    async def generate_all(self, text: str, context: str = None) -> dict:
+        """Generate the explanation and practice problems concurrently"""
+        explanation, problems = await asyncio.gather(
+            self.explain_text(text, context),
+            self.create_problems(text, context),
+        )
+        return {"explanation": explanation, "problems": problems}
 
+    async def explain_text_stream(self, text: str, context: str = None) -> AsyncIterator[str]:
+        """Like explain_text, but yields the answer in chunks as it is generated"""
+        if self.mock_mode:
+            yield await self.explain_text(text, context)
+            return
+        async for chunk in self._generate_stream(
+            self._explain_prompt(text, context), EXPLAIN_SYSTEM, cache_key=("explain", text, context or "")
+        ):
+            yield chunk
+
+    async def create_problems_stream(self, text: str, context: str = None) -> AsyncIterator[str]:
+        """Like create_problems, but yields the answer in chunks as it is generated"""
+        if self.mock_mode:
+            yield await self.create_problems(text, context)
+            return
+        async for chunk in self._generate_stream(
+            self._problems_prompt(text, context), PROBLEM_SYSTEM, cache_key=("problem", text, context or "")
+        ):
+            yield chunk
+
+    async def chat_stream(self, message: str, history: list, context: str = None) -> AsyncIterator[str]:
+        """Like chat, but yields the answer in chunks as it is generated"""
+        if self.mock_mode:
+            yield await self.chat(message, history, context)
+            return
+        async for chunk in self._generate_stream(
+            self._chat_prompt(message, history, context),
+            CHAT_SYSTEM,
+            cache_key=("chat", message, self._chat_scope(history, context)),
+        ):
+            yield chunk
+
+    async def _generate(self, prompt: str, system: str = None, max_retries: int = None, cache_key: tuple = None) -> str:
+        # cache_key is (kind, text, scope) for SemanticCache; errors are never cached
+        if self.cache and cache_key:
+            cached = await asyncio.to_thread(self.cache.get, *cache_key)
+            if cached is not None:
+                print(f"DEBUG: LLM cache hit ({cache_key[0]})")
+                return cached
+
+        max_retries = max_retries or self.max_retries
         for attempt in range(max_retries):
+            await self._wait_for_cooldown()
             try:
                 print(f"DEBUG: Generating content with model gemini-2.0-flash... (attempt {attempt + 1})")
-                response = self.client.models.generate_content(
+                # Non-blocking call so concurrent requests don't tie up threads
+                response = await self.client.aio.models.generate_content(
                     model="gemini-2.0-flash",
-                    contents=prompt
+                    contents=prompt,
+                    config=types.GenerateContentConfig(system_instruction=system)
                 )
                 print(f"DEBUG: Generation successful. Length: {len(response.text) if response.text else 0}")
                 if not response.text:
                     print(f"DEBUG: Response text is empty/None! Candidates: {response.candidates}")
+                elif self.cache and cache_key:
+                    await asyncio.to_thread(self.cache.put, *cache_key, response.text)
                 return response.text
 
             except Exception as e:
-                error_str = str(e)
                 print(f"LLM Generation Error (attempt {attempt + 1}): {e}")
 
                 # Check for rate limit error
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+                if self._is_rate_limited(e):
                     if attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 5  # 5, 10, 15 seconds
-                        print(f"Rate limited. Waiting {wait_time} seconds before retry...")
-                        time.sleep(wait_time)
+                        delay = self._start_cooldown(attempt)
+                        print(f"Rate limited. Retrying in {delay:.1f} seconds...")
                         continue
                     else:
                         return "APIの利用制限に達しました。しばらく待ってから再度お試しください。"
@@ -125,5 +380,66 @@ class LLMService:
 
         return "リクエストに失敗しました。しばらく待ってから再度お試しください。"
 
-# Global instance
-llm_service = LLMService()
+    async def _generate_stream(
+        self, prompt: str, system: str = None, max_retries: int = None, cache_key: tuple = None
+    ) -> AsyncIterator[str]:
+        """Streaming variant of _generate; retries only before the first chunk was sent"""
+        if self.cache and cache_key:
+            cached = await asyncio.to_thread(self.cache.get, *cache_key)
+            if cached is not None:
+                print(f"DEBUG: LLM cache hit ({cache_key[0]})")
+                yield cached
+                return
+
+        max_retries = max_retries or self.max_retries
+        for attempt in range(max_retries):
+            await self._wait_for_cooldown()
+            sent = False
+            parts = []
+            try:
+                print(f"DEBUG: Streaming content with model gemini-2.0-flash... (attempt {attempt + 1})")
+                stream = await self.client.aio.models.generate_content_stream(
+                    model="gemini-2.0-flash",
+                    contents=prompt,
+                    config=types.GenerateContentConfig(system_instruction=system)
+                )
+                async for chunk in stream:
+                    if chunk.text:
+                        sent = True
+                        parts.append(chunk.text)
+                        yield chunk.text
+                if parts and self.cache and cache_key:
+                    await asyncio.to_thread(self.cache.put, *cache_key, "".join(parts))
+                return
+
+            except Exception as e:
+                print(f"LLM Streaming Error (attempt {attempt + 1}): {e}")
+
+                # Check for rate limit error
+                if not sent and self._is_rate_limited(e):
+                    if attempt < max_retries - 1:
+                        delay = self._start_cooldown(attempt)
+                        print(f"Rate limited. Retrying in {delay:.1f} seconds...")
+                        continue
+                    yield "APIの利用制限に達しました。しばらく待ってから再度お試しください。"
+                    return
+
+                # Other errors
+                import traceback
+                traceback.print_exc()
+                yield f"エラーが発生しました: {str(e)}"
+                return
+
+        yield "リクエストに失敗しました。しばらく待ってから再度お試しください。"
+
+# Global instance, created on first use so importing the module (and starting
+# the server) doesn't construct the Gemini client or open the cache DB
+_llm_service = None
+
+
+def get_llm_service() -> LLMService:
+    """Return the shared LLMService, creating it on first call"""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 from contextlib import asynccontextmanager
 
 # Add parent directory to path to import existing modules
@@ -9,17 +10,31 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from backend.api import router as api_router
+from backend.api import router as api_router, warm_up_ocr
 from backend.camera_manager import camera_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up...")
-    try:
-        camera_manager.initialize()
-    except Exception as e:
-        print(f"Error initializing camera: {e}")
+
+    # Opening the camera can block for seconds (network timeouts, retries),
+    # so run it off the event loop, in parallel with the OCR model load
+    async def init_camera():
+        try:
+            await asyncio.to_thread(camera_manager.initialize)
+        except Exception as e:
+            print(f"Error initializing camera: {e}")
+
+    # Pre-load and warm up the OCR model so the first capture doesn't pay
+    # the load cost; runs on the OCR worker thread that will serve captures
+    async def load_ocr():
+        try:
+            await asyncio.wrap_future(warm_up_ocr())
+        except Exception as e:
+            print(f"Error loading OCR model: {e}")
+
+    await asyncio.gather(init_camera(), load_ocr())
 
     yield
 
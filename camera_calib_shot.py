@@ -13,13 +13,27 @@ Features:
 import argparse
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
 import cv2
 
 
+def _make_session():
+    """Shared keep-alive session for snapshot fetches (one camera host)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = _make_session()
+
+
 def make_blob_detector(
     min_area=200,
     max_area=1_000_000,
@@ -50,9 +64,9 @@ def make_blob_detector(
     return cv2.SimpleBlobDetector_create(params)
 
 
-def fetch_image_from_url(url, timeout=5.0):
+def fetch_image_from_url(url, timeout=5.0, session=None):
     try:
-        r = requests.get(url, timeout=timeout)
+        r = (session or _session).get(url, timeout=timeout)
     except Exception as e:
         print(f"エラー: 取得に失敗しました: {e}")
         return None
@@ -64,6 +78,14 @@ def fetch_image_from_url(url, timeout=5.0):
     return img
 
 
+def _fetch_at(url, start_at):
+    """Wait until start_at (time.monotonic) and fetch; runs on the prefetch thread"""
+    delay = start_at - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+    return fetch_image_from_url(url)
+
+
 def capture_images(
     url,
     count=5,
@@ -91,102 +113,123 @@ def capture_images(
         if autodetect
         else None
     )
+    # Frame-invariant; created once instead of per frame
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)) if autodetect else None
     saved = []
-    for i in range(count):
-        ts_dbg = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        img = fetch_image_from_url(url)
-        if img is None:
-            print(f"{i+1}/{count}: 取得失敗、{interval}s後に再試行")
-            time.sleep(interval)
-            continue
-
-        save_it = True
-        if autodetect:
-            # Try multiple preprocessing pipelines because very high-res images
-            # may need resizing / histogram equalization / adaptive thresholding.
-            gray_full = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            pipelines = []
-
-            # 1) basic blurred full-res
-            pipelines.append(("blur", cv2.GaussianBlur(gray_full, (5, 5), 0)))
-
-            # 2) CLAHE (local contrast enhancement)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            pipelines.append(("clahe", clahe.apply(gray_full)))
-
-            # 3) equalize histogram
-            pipelines.append(("equalize", cv2.equalizeHist(gray_full)))
-
-            # 4) resized (half) - sometimes detector expects smaller blobs
-            h, w = gray_full.shape[:2]
-            if max(w, h) > 1500:
-                resized = cv2.resize(
-                    gray_full, (w // 2, h // 2), interpolation=cv2.INTER_AREA
-                )
-                pipelines.append(("resized_half", cv2.GaussianBlur(resized, (5, 5), 0)))
-
-            # 5) adaptive threshold (binary) and blur
-            adapt = cv2.adaptiveThreshold(
-                gray_full, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-            )
-            pipelines.append(("adaptive_thresh", cv2.GaussianBlur(adapt, (5, 5), 0)))
-
-            found = False
-            centers = None
-            found_pipeline = None
-            for name, proc in pipelines:
-                # If we used a resized image, need to pass the correct image to findCirclesGrid
-                img_for_search = proc
-                # For detection with a resized image, use the same detector (it expects blobs sized to that image)
-                try:
-                    ok, pts = cv2.findCirclesGrid(
-                        img_for_search,
-                        pattern_size,
-                        flags=cv2.CALIB_CB_ASYMMETRIC_GRID,
-                        blobDetector=detector,
+    # 次の画像の取得（通信・デコード）を別スレッドで先に始め、検出処理と重ねる
+    fetcher = ThreadPoolExecutor(max_workers=1)
+    pending = fetcher.submit(_fetch_at, url, time.monotonic())
+    try:
+        for i in range(count):
+            ts_dbg = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+            img = pending.result()
+            if i + 1 < count:
+                pending = fetcher.submit(_fetch_at, url, time.monotonic() + interval)
+            if img is None:
+                print(f"{i+1}/{count}: 取得失敗、{interval}s後に再試行")
+                continue
+
+            save_it = True
+            if autodetect:
+                # Try multiple preprocessing pipelines because very high-res images
+                # may need resizing / histogram equalization / adaptive thresholding.
+                # Each pipeline is built lazily, so the expensive ones (CLAHE,
+                # adaptive threshold) only run if the cheaper ones failed.
+                gray_full = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                h, w = gray_full.shape[:2]
+
+                # 1) basic blurred full-res
+                def _p_blur():
+                    return cv2.GaussianBlur(gray_full, (5, 5), 0)
+
+                # 2) CLAHE (local contrast enhancement)
+                def _p_clahe():
+                    return clahe.apply(gray_full)
+
+                # 3) equalize histogram
+                def _p_equalize():
+                    return cv2.equalizeHist(gray_full)
+
+                # 4) resized (half) - sometimes detector expects smaller blobs
+                def _p_resized_half():
+                    resized = cv2.resize(
+                        gray_full, (w // 2, h // 2), interpolation=cv2.INTER_AREA
+                    )
+                    return cv2.GaussianBlur(resized, (5, 5), 0)
+
+                # 5) adaptive threshold (binary) and blur
+                def _p_adaptive_thresh():
+                    adapt = cv2.adaptiveThreshold(
+                        gray_full, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
                     )
-                except Exception as e:
-                    print(f"findCirclesGrid error on pipeline {name}: {e}")
-                    ok = False
-                    pts = None
-
-                if ok:
-                    found = True
-                    centers = pts
-                    found_pipeline = name
-                    print(f"{i+1}/{count}: パターン検出 成功 — パイプライン: {name}")
-                    break
-
-            # Draw and save debug images (annotated)
-            if centers is not None:
-                # If centers are from a resized image, they are in resized coords. Attempt to draw on original.
-                try:
-                    cv2.drawChessboardCorners(img, pattern_size, centers, found)
-                except Exception:
-                    # Fallback: ignore drawing failure
-                    pass
-            debug_filename = f"debug_{ts_dbg}_{i+1}.jpg"
-            debug_path = os.path.join(debug_dir, debug_filename)
-            cv2.imwrite(debug_path, img)
-
-            if not found:
-                print(f"{i+1}/{count}: パターン検出失敗 — 保存しません")
-                save_it = False
-            else:
-                print(
-                    f"{i+1}/{count}: パターン検出 成功 (pipeline={found_pipeline}) — 保存します"
-                )
-
-        if save_it:
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"capture_{ts}_{i+1}.jpg"
-            path = os.path.join(save_dir, filename)
-            cv2.imwrite(path, img)
-            saved.append(path)
-            print(f"保存: {path}")
-
-        time.sleep(interval)
+                    return cv2.GaussianBlur(adapt, (5, 5), 0)
+
+                pipelines = [
+                    ("blur", _p_blur),
+                    ("clahe", _p_clahe),
+                    ("equalize", _p_equalize),
+                ]
+                if max(w, h) > 1500:
+                    pipelines.append(("resized_half", _p_resized_half))
+                pipelines.append(("adaptive_thresh", _p_adaptive_thresh))
+
+                found = False
+                centers = None
+                found_pipeline = None
+                for name, build in pipelines:
+                    # If we used a resized image, need to pass the correct image to findCirclesGrid
+                    img_for_search = build()
+                    # For detection with a resized image, use the same detector (it expects blobs sized to that image)
+                    try:
+                        ok, pts = cv2.findCirclesGrid(
+                            img_for_search,
+                            pattern_size,
+                            flags=cv2.CALIB_CB_ASYMMETRIC_GRID,
+                            blobDetector=detector,
+                        )
+                    except Exception as e:
+                        print(f"findCirclesGrid error on pipeline {name}: {e}")
+                        ok = False
+                        pts = None
+
+                    if ok:
+                        found = True
+                        centers = pts
+                        found_pipeline = name
+                        print(f"{i+1}/{count}: パターン検出 成功 — パイプライン: {name}")
+                        break
+
+                # Draw and save debug images (annotated)
+                if centers is not None:
+                    # If centers are from a resized image, they are in resized coords. Attempt to draw on original.
+                    try:
+                        cv2.drawChessboardCorners(img, pattern_size, centers, found)
+                    except Exception:
+                        # Fallback: ignore drawing failure
+                        pass
+                debug_filename = f"debug_{ts_dbg}_{i+1}.jpg"
+                debug_path = os.path.join(debug_dir, debug_filename)
+                cv2.imwrite(debug_path, img)
+
+                if not found:
+                    print(f"{i+1}/{count}: パターン検出失敗 — 保存しません")
+                    save_it = False
+                else:
+                    print(
+                        f"{i+1}/{count}: パターン検出 成功 (pipeline={found_pipeline}) — 保存します"
+                    )
+
+            if save_it:
+                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"capture_{ts}_{i+1}.jpg"
+                path = os.path.join(save_dir, filename)
+                cv2.imwrite(path, img)
+                saved.append(path)
+                print(f"保存: {path}")
+    finally:
+        # 中断・例外時も実行中の取得を待たずに後続の取得をキャンセルして終了する
+        fetcher.shutdown(wait=False, cancel_futures=True)
 
     print(f"完了: {len(saved)} / {count} 枚を保存しました。")
     return saved
@@ -4,17 +4,37 @@ config.yamlを読み込んで、アプリケーション設定を提供します
 """
 
 import os
+import threading
 import yaml
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
 from dotenv import load_dotenv
 
+# libyamlが使える場合はCローダーで高速にパースする
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # Load .env file
 load_dotenv()
 
 
+def _deepfreeze(value: Any) -> Any:
+    """辞書を読み取り専用ビューに、リストをタプルに再帰的に変換する"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _deepfreeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_deepfreeze(v) for v in value)
+    return value
+
+
 class ConfigLoader:
     """設定ファイルを読み込むクラス"""
 
+    # 属性を固定してインスタンス辞書を持たない（毎フレーム参照されるため）
+    __slots__ = ("config_path", "config", "_flat")
+
     def __init__(self, config_path: Optional[str] = None):
         """
         初期化
@@ -29,18 +49,24 @@ class ConfigLoader:
 
         self.config_path = config_path
         self.config = self._load_config()
+        # 全てのキーの組をタプルで引ける平坦な辞書（設定は読み込み後に変わらないため一度だけ作る）
+        self._flat: Dict[tuple, Any] = {}
+        self._flatten(self.config, ())
 
-    def _load_config(self) -> Dict[str, Any]:
-        """設定ファイルを読み込む"""
+    def _load_config(self) -> Mapping[str, Any]:
+        """
+        設定ファイルを読み込む
+        get() の結果は全スレッドで共有するため、書き換えられないよう凍結して返す
+        """
         if not os.path.exists(self.config_path):
             raise FileNotFoundError(f"設定ファイルが見つかりません: {self.config_path}")
 
         try:
             with open(self.config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            return config if config else {}
+                config = yaml.load(f, Loader=_YamlLoader)
         except yaml.YAMLError as e:
             raise ValueError(f"設定ファイルの読み込みに失敗しました: {e}")
+        return _deepfreeze(config if config else {})
 
     def get(self, *keys, default=None) -> Any:
         """
@@ -52,17 +78,21 @@ class ConfigLoader:
 
         Returns:
             設定値、見つからない場合はdefault
+            値は全スレッドで共有されるため読み取り専用: セクション(辞書)は
+            MappingProxyType、リストはタプルで返る。書き換えようとすると
+            TypeError / AttributeError になるので、変更したい場合はコピーすること
 
         Example:
             config.get('camera', 'network', 'video_url')
         """
-        value = self.config
-        for key in keys:
-            if isinstance(value, dict) and key in value:
-                value = value[key]
-            else:
-                return default
-        return value
+        return self._flat.get(keys, default)
+
+    def _flatten(self, value: Any, prefix: tuple) -> None:
+        """ネストされた辞書をたどり、途中のセクションも含めて全てのキーの組を登録する"""
+        self._flat[prefix] = value
+        if isinstance(value, Mapping):
+            for key, child in value.items():
+                self._flatten(child, prefix + (key,))
 
     def get_camera_type(self) -> str:
         """カメラタイプを取得"""
@@ -94,6 +124,18 @@ class ConfigLoader:
         """ローカルカメラのデバイスインデックスを取得"""
         return self.get("camera", "local", "device_index", default=0)
 
+    def get_local_fourcc(self) -> str:
+        """ローカルカメラに要求するピクセルフォーマット（FOURCC）を取得（空なら変更しない）"""
+        return self.get("camera", "local", "fourcc", default="MJPG")
+
+    def get_local_width(self) -> int:
+        """ローカルカメラに要求する横解像度を取得（0なら変更しない）"""
+        return self.get("camera", "local", "width", default=0)
+
+    def get_local_height(self) -> int:
+        """ローカルカメラに要求する縦解像度を取得（0なら変更しない）"""
+        return self.get("camera", "local", "height", default=0)
+
     def get_buffer_size(self) -> int:
         """カメラバッファサイズを取得"""
         return self.get("camera", "buffer_size", default=1)
@@ -102,6 +144,14 @@ class ConfigLoader:
         """フレーム更新間隔（ミリ秒）を取得"""
         return self.get("camera", "frame_interval_ms", default=30)
 
+    def get_stream_max_width(self) -> int:
+        """プレビュー配信の最大幅（px）を取得"""
+        return self.get("camera", "stream_max_width", default=800)
+
+    def get_stream_jpeg_quality(self) -> int:
+        """プレビュー配信のJPEG品質を取得"""
+        return self.get("camera", "stream_jpeg_quality", default=65)
+
     def get_aruco_dict_type(self) -> str:
         """ArUco辞書タイプを取得"""
         return self.get("aruco", "dict_type", default="DICT_4X4_50")
@@ -114,6 +164,18 @@ class ConfigLoader:
         """ArUcoマーカーの充填率閾値を取得"""
         return self.get("aruco", "fill_threshold", default=0.6)
 
+    def get_aruco_detection_scale(self) -> float:
+        """ArUco検出時の縮小率を取得（1.0で縮小なし）"""
+        return self.get("aruco", "detection_scale", default=0.5)
+
+    def get_aruco_detect_interval(self) -> int:
+        """ArUco検出を何フレームに1回行うかを取得（間のフレームは直前の結果を使う）"""
+        return self.get("aruco", "detect_interval", default=3)
+
+    def get_aruco_use_opencl(self) -> bool:
+        """ArUco検出の前処理（グレースケール化・縮小）にOpenCLを使うかを取得"""
+        return self.get("aruco", "use_opencl", default=False)
+
     def get_auto_capture_delay_ms(self) -> int:
         """自動撮影の遅延時間（ミリ秒）を取得"""
         return self.get("aruco", "auto_capture_delay_ms", default=2000)
@@ -144,10 +206,10 @@ class ConfigLoader:
             "image_processing", "white_balance", "enabled_by_default", default=True
         )
 
-    def get_gaussian_blur_kernel(self) -> list:
-        """ガウシアンブラーのカーネルサイズを取得"""
+    def get_gaussian_blur_kernel(self) -> Tuple[int, ...]:
+        """ガウシアンブラーのカーネルサイズを取得（読み取り専用のタプル）"""
         return self.get(
-            "image_processing", "edge_detection", "gaussian_blur_kernel", default=[5, 5]
+            "image_processing", "edge_detection", "gaussian_blur_kernel", default=(5, 5)
         )
 
     def get_canny_threshold1(self) -> int:
@@ -178,6 +240,22 @@ class ConfigLoader:
             "image_processing", "hough_transform", "max_line_gap", default=30
         )
 
+    def get_ocr_workers(self) -> int:
+        """OCRワーカースレッド数を取得"""
+        return self.get("ocr", "workers", default=1)
+
+    def get_ocr_max_pending(self) -> int:
+        """OCR待ちキューの最大件数を取得（超えた分は破棄）"""
+        return self.get("ocr", "max_pending", default=8)
+
+    def get_ocr_max_dim(self) -> int:
+        """OCRに渡す画像の長辺の上限(px)を取得"""
+        return self.get("ocr", "max_dim", default=1600)
+
+    def get_ocr_device(self) -> str:
+        """OCRの実行デバイスを取得（"auto"の場合はCUDAが使えればGPU）"""
+        return self.get("ocr", "device", default="auto")
+
     def get_window_width(self) -> int:
         """ウィンドウ幅を取得"""
         return self.get("ui", "window", "width", default=1200)
@@ -194,6 +272,50 @@ class ConfigLoader:
         """ビデオラベルの最小高さを取得"""
         return self.get("ui", "video_label", "min_height", default=480)
 
+    def get_opencv_threads(self) -> int:
+        """OpenCV内部の並列スレッド数を取得（0で既定値）"""
+        return self.get("cpu", "opencv_threads", default=0)
+
+    def get_ocr_threads(self) -> int:
+        """OCR推論（PyTorch/OpenMP）の並列スレッド数を取得（0で既定値）"""
+        return self.get("cpu", "ocr_threads", default=0)
+
+    def get_camera_cpu_affinity(self) -> Tuple[int, ...]:
+        """カメラスレッドを固定するCPUコア番号を取得（読み取り専用のタプル）"""
+        return self.get("cpu", "camera_affinity", default=()) or ()
+
+    def get_ocr_cpu_affinity(self) -> Tuple[int, ...]:
+        """OCRスレッドを固定するCPUコア番号を取得（読み取り専用のタプル）"""
+        return self.get("cpu", "ocr_affinity", default=()) or ()
+
+    def get_llm_max_retries(self) -> int:
+        """LLM呼び出しの最大試行回数を取得"""
+        return self.get("llm", "max_retries", default=3)
+
+    def get_llm_max_backoff_s(self) -> float:
+        """LLMリトライ待ち時間の上限（秒）を取得"""
+        return self.get("llm", "max_backoff_s", default=30.0)
+
+    def get_llm_cache_enabled(self) -> bool:
+        """LLM回答キャッシュを使うかを取得"""
+        return self.get("llm", "semantic_cache", "enabled", default=True)
+
+    def get_llm_cache_max_entries(self) -> int:
+        """LLM回答キャッシュの最大件数を取得"""
+        return self.get("llm", "semantic_cache", "max_entries", default=256)
+
+    def get_llm_cache_similarity_threshold(self) -> float:
+        """LLM回答キャッシュで類似とみなすコサイン類似度を取得"""
+        return self.get("llm", "semantic_cache", "similarity_threshold", default=0.9)
+
+    def get_llm_cache_db_file(self) -> str:
+        """LLM回答キャッシュの保存先DBファイル名を取得（空ならメモリのみ。相対パスはconfig.yaml基準）"""
+        return self.get("llm", "semantic_cache", "db_file", default="")
+
+    def get_llm_cache_embedding_model(self) -> str:
+        """LLM回答キャッシュの埋め込みモデル名を取得（空なら完全一致のみ）"""
+        return self.get("llm", "semantic_cache", "embedding_model", default="")
+
     def get_ocr_output_max_height(self) -> int:
         """OCR出力エリアの最大高さを取得"""
         return self.get("ui", "ocr_output", "max_height", default=150)
@@ -213,18 +335,23 @@ class ConfigLoader:
 
 # グローバルインスタンス（アプリケーション起動時に一度だけ読み込む）
 _config_instance = None
+_config_lock = threading.Lock()
 
 
 def get_config() -> ConfigLoader:
-    """設定のグローバルインスタンスを取得"""
+    """設定のグローバルインスタンスを取得（生成済みならロックを取らない）"""
     global _config_instance
     if _config_instance is None:
-        _config_instance = ConfigLoader()
+        with _config_lock:
+            # 複数スレッドから同時に呼ばれても読み込みは一度だけ
+            if _config_instance is None:
+                _config_instance = ConfigLoader()
     return _config_instance
 
 
 def reload_config():
     """設定を再読み込み"""
     global _config_instance
-    _config_instance = ConfigLoader()
+    with _config_lock:
+        _config_instance = ConfigLoader()
     return _config_instance
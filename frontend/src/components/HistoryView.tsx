@@ -4,6 +4,34 @@ import { ImageOverlay } from './ImageOverlay';
 
 const API_BASE = "http://127.0.0.1:8000/api";
 
+// POST JSON and read the server-sent events ({token} ... {done}) from the response
+const streamTokens = async (url: string, body: unknown, onToken: (token: string) => void, signal?: AbortSignal) => {
+    const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal
+    });
+    if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) return;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+        for (const event of events) {
+            if (!event.startsWith("data: ")) continue;
+            const data = JSON.parse(event.slice(6));
+            if (data.done) return;
+            if (data.token) onToken(data.token);
+        }
+    }
+};
+
 interface Capture {
     filename: string;
     filepath: string;
@@ -33,6 +61,46 @@ export const HistoryView: React.FC = () => {
     const [chatInput, setChatInput] = useState("");
     const [chatContext, setChatContext] = useState<string>("");  // Store document context for chat
     const chatEndRef = useRef<HTMLDivElement>(null);
+    const llmAbortRef = useRef<AbortController | null>(null);  // In-flight AI request, if any
+
+    // Abort the in-flight AI request (closing the backend stream stops generation)
+    const cancelLlm = () => {
+        llmAbortRef.current?.abort();
+        llmAbortRef.current = null;
+    };
+
+    const startLlm = (): AbortController => {
+        cancelLlm();
+        const controller = new AbortController();
+        llmAbortRef.current = controller;
+        return controller;
+    };
+
+    const finishLlm = (controller: AbortController) => {
+        // Ignore requests that were already replaced or cancelled
+        if (llmAbortRef.current === controller) {
+            llmAbortRef.current = null;
+            setLlmLoading(false);
+        }
+    };
+
+    // Cancel on unmount. The controller lives in the ref, so the cleanup reads
+    // whatever is in flight then (not a first-render closure)
+    useEffect(() => {
+        const abortRef = llmAbortRef;
+        return () => abortRef.current?.abort();
+    }, []);
+
+    // Append a streamed chunk to the assistant message at the end of the chat
+    const appendAssistantToken = (token: string) => {
+        setChatHistory(prev => {
+            const last = prev[prev.length - 1];
+            if (last && last.role === 'assistant') {
+                return [...prev.slice(0, -1), { ...last, content: last.content + token }];
+            }
+            return [...prev, { role: 'assistant', content: token }];
+        });
+    };
 
     // Auto-scroll chat to bottom
     useEffect(() => {
@@ -46,6 +114,8 @@ export const HistoryView: React.FC = () => {
     // Auto-fetch OCR when selection changes
     useEffect(() => {
         if (selectedCapture) {
+            cancelLlm(); // The answer would belong to the previous capture
+            setLlmLoading(false);
             setOcrResult(null); // Clear previous
             setChatHistory([]); // Clear chat history
             setChatInput("");
@@ -110,6 +180,7 @@ export const HistoryView: React.FC = () => {
         if (selectedTexts.size === 0) return;
 
         setLlmLoading(true);
+        const controller = startLlm();
 
         try {
             const context = extractFullText(ocrResult);
@@ -118,28 +189,26 @@ export const HistoryView: React.FC = () => {
             // Store context for future chat
             setChatContext(context);
 
-            const res = await fetch(`${API_BASE}/study_support`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: selectedText, type, context })
-            });
-            const data = await res.json();
-
-            // Initialize chat with the first exchange
+            // Initialize chat with the first exchange; the answer is streamed in below
             const userMessage = type === 'explain'
                 ? `「${selectedText.slice(0, 50)}${selectedText.length > 50 ? '...' : ''}」について解説してください`
                 : `「${selectedText.slice(0, 50)}${selectedText.length > 50 ? '...' : ''}」に関する練習問題を作成してください`;
 
-            setChatHistory([
-                { role: 'user', content: userMessage },
-                { role: 'assistant', content: data.content }
-            ]);
+            setChatHistory([{ role: 'user', content: userMessage }]);
             clearSelections(); // Clear after submitting
+
+            await streamTokens(
+                `${API_BASE}/study_support/stream`,
+                { text: selectedText, type, context },
+                appendAssistantToken,
+                controller.signal
+            );
         } catch (e) {
+            if (controller.signal.aborted) return;
             console.error("LLM Error", e);
             alert("AIからの応答の取得に失敗しました");
         } finally {
-            setLlmLoading(false);
+            finishLlm(controller);
         }
     };
 
@@ -150,32 +219,32 @@ export const HistoryView: React.FC = () => {
         const userMessage = chatInput.trim();
         setChatInput("");
         setLlmLoading(true);
+        const controller = startLlm();
 
         // Add user message to history immediately
         const newHistory = [...chatHistory, { role: 'user', content: userMessage }];
         setChatHistory(newHistory);
 
         try {
-            const res = await fetch(`${API_BASE}/chat`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
+            // AI response is appended to history as it streams in
+            await streamTokens(
+                `${API_BASE}/chat/stream`,
+                {
                     message: userMessage,
                     history: chatHistory,
                     context: chatContext
-                })
-            });
-            const data = await res.json();
-
-            // Add AI response to history
-            setChatHistory([...newHistory, { role: 'assistant', content: data.content }]);
+                },
+                appendAssistantToken,
+                controller.signal
+            );
         } catch (e) {
+            if (controller.signal.aborted) return;
             console.error("Chat Error", e);
             // Remove the user message if failed
             setChatHistory(chatHistory);
             alert("送信に失敗しました");
         } finally {
-            setLlmLoading(false);
+            finishLlm(controller);
         }
     };
 
@@ -385,7 +454,7 @@ export const HistoryView: React.FC = () => {
                                     <h3 className="text-xl font-bold text-secondary-light flex items-center gap-2">
                                         💬 AI チャット
                                     </h3>
-                                    <button onClick={() => { setChatHistory([]); setChatContext(""); }} className="text-gray-400 hover:text-white text-xl px-2">✕</button>
+                                    <button onClick={() => { cancelLlm(); setLlmLoading(false); setChatHistory([]); setChatContext(""); }} className="text-gray-400 hover:text-white text-xl px-2">✕</button>
                                 </div>
 
                                 {/* Chat Messages */}
@@ -420,7 +489,7 @@ export const HistoryView: React.FC = () => {
                                             </div>
                                         </div>
                                     ))}
-                                    {llmLoading && (
+                                    {llmLoading && chatHistory[chatHistory.length - 1]?.role !== 'assistant' && (
                                         <div className="flex justify-start">
                                             <div className="bg-gray-800 rounded-2xl rounded-bl-sm px-4 py-3">
                                                 <div className="flex items-center space-x-2">